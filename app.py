@@ -5,13 +5,21 @@ from flask import (
     redirect,
     url_for,
     session,
+    Response,
+    abort,
+    send_file,
 )
 import os
 import datetime
 import threading
-import json # For saving/loading crawled_data.json
 import crawler
+import artifacts
 import comparator
+import crawl_manifest
+import instrumentation
+import masks
+import metrics
+import path_matcher
 
 SCREENSHOT_DIRECTORY_NAME = "screenshots"
 
@@ -31,34 +39,9 @@ comparison_results = []
 crawl_status = {"running": False, "message": ""}
 
 # --- Helper Functions for Managing Crawled Data ---
-def save_crawled_data(data_to_save, directory_path, filename="crawled_data.json"):
-    if not data_to_save:
-        print(f"Warning: No data provided to save for {directory_path}")
-        return
-    if not os.path.exists(directory_path):
-        os.makedirs(directory_path, exist_ok=True)
-    filepath = os.path.join(directory_path, filename)
-    try:
-        with open(filepath, 'w') as f:
-            json.dump(data_to_save, f, indent=4)
-        print(f"Crawled data saved successfully to {filepath}")
-    except Exception as e:
-        print(f"ERROR: Could not save crawled data to {filepath}: {e}")
-
-def load_crawled_data(full_directory_path, filename="crawled_data.json"):
-    filepath = os.path.join(full_directory_path, filename)
-    try:
-        with open(filepath, 'r') as f:
-            data = json.load(f)
-        print(f"Crawled data loaded successfully from {filepath}")
-        return data
-    except FileNotFoundError:
-        print(f"ERROR: Crawled data file not found at {filepath}. Cannot load.")
-    except json.JSONDecodeError:
-        print(f"ERROR: Crawled data file at {filepath} is corrupted or not valid JSON.")
-    except Exception as e:
-        print(f"ERROR: Could not load crawled data from {filepath}: {e}")
-    return None
+def load_crawled_data(full_directory_path):
+    # Manifest crawls are read lazily; older crawls fall back to crawled_data.json
+    return crawl_manifest.load_crawl(full_directory_path)
 
 def list_available_crawls_grouped(base_screenshot_dir):
     grouped_crawls = {}
@@ -73,7 +56,7 @@ def list_available_crawls_grouped(base_screenshot_dir):
             for timestamp_folder in os.listdir(abs_site_path):
                 abs_timestamp_path = os.path.join(abs_site_path, timestamp_folder)
                 if os.path.isdir(abs_timestamp_path) and \
-                   os.path.exists(os.path.join(abs_timestamp_path, "crawled_data.json")):
+                   crawl_manifest.has_crawl_data(abs_timestamp_path):
                     timestamps.append(timestamp_folder)
             if timestamps:
                 grouped_crawls[site_name_folder] = sorted(timestamps, reverse=True) # Newest first
@@ -89,6 +72,12 @@ def index():
     form_url2 = session.get("last_url2", "")
     selected_existing_crawl1 = session.get('last_existing_crawl_url1', '')
     selected_existing_crawl2 = session.get('last_existing_crawl_url2', '')
+    form_rewrite_rules = session.get('last_rewrite_rules', '')
+    form_analysis_mode = session.get('last_analysis_mode', 'standard')
+    form_skip_pixel_on_dom_match = session.get('last_skip_pixel_on_dom_match', False)
+    form_mask_rules = session.get('last_mask_rules', '')
+    form_use_decoded_cache = session.get('last_use_decoded_cache', False)
+    form_capture_matrix = session.get('last_capture_matrix', '')
 
     if request.method == "POST":
         form_url1 = request.form.get("url1")
@@ -100,6 +89,20 @@ def index():
         selected_existing_crawl2 = request.form.get('existing_crawl_url2', '')
         session['last_existing_crawl_url1'] = selected_existing_crawl1
         session['last_existing_crawl_url2'] = selected_existing_crawl2
+        form_rewrite_rules = request.form.get('rewrite_rules', '')
+        session['last_rewrite_rules'] = form_rewrite_rules
+        form_analysis_mode = request.form.get('analysis_mode', 'standard')
+        if form_analysis_mode not in metrics.ANALYSIS_PRESETS:
+            form_analysis_mode = 'standard'
+        session['last_analysis_mode'] = form_analysis_mode
+        form_skip_pixel_on_dom_match = request.form.get('skip_pixel_on_dom_match') == '1'
+        session['last_skip_pixel_on_dom_match'] = form_skip_pixel_on_dom_match
+        form_mask_rules = request.form.get('mask_rules', '')
+        session['last_mask_rules'] = form_mask_rules
+        form_use_decoded_cache = request.form.get('use_decoded_cache') == '1'
+        session['last_use_decoded_cache'] = form_use_decoded_cache
+        form_capture_matrix = request.form.get('capture_matrix', '')
+        session['last_capture_matrix'] = form_capture_matrix
 
         available_crawls_for_template = list_available_crawls_grouped(app.config['UPLOAD_FOLDER'])
 
@@ -109,6 +112,12 @@ def index():
                                    form_url1=form_url1, form_url2=form_url2,
                                    selected_existing_crawl1=selected_existing_crawl1,
                                    selected_existing_crawl2=selected_existing_crawl2,
+                                   form_rewrite_rules=form_rewrite_rules,
+                                   form_analysis_mode=form_analysis_mode,
+                                   form_skip_pixel_on_dom_match=form_skip_pixel_on_dom_match,
+                                   form_mask_rules=form_mask_rules,
+                                   form_use_decoded_cache=form_use_decoded_cache,
+                                   form_capture_matrix=form_capture_matrix,
                                    available_crawls=available_crawls_for_template)
         if crawl_status["running"]:
             return render_template("index.html", error="A crawl is already in progress.",
@@ -116,6 +125,12 @@ def index():
                                    form_url1=form_url1, form_url2=form_url2,
                                    selected_existing_crawl1=selected_existing_crawl1,
                                    selected_existing_crawl2=selected_existing_crawl2,
+                                   form_rewrite_rules=form_rewrite_rules,
+                                   form_analysis_mode=form_analysis_mode,
+                                   form_skip_pixel_on_dom_match=form_skip_pixel_on_dom_match,
+                                   form_mask_rules=form_mask_rules,
+                                   form_use_decoded_cache=form_use_decoded_cache,
+                                   form_capture_matrix=form_capture_matrix,
                                    available_crawls=available_crawls_for_template)
 
         comparison_results = [] # Reset results for new comparison
@@ -145,10 +160,20 @@ def index():
         crawl_status["running"] = True
         crawl_status["message"] = "Processing... preparing to crawl or load data."
         
+        rewrite_rules = path_matcher.parse_rewrite_rules(form_rewrite_rules)
+        mask_rules = masks.parse_mask_rules(form_mask_rules)
+        capture_matrix = crawler.parse_capture_matrix(form_capture_matrix)
+
         thread = threading.Thread(target=run_comparison_workflow,
                                   args=(form_url1, site1_info,
                                         form_url2, site2_info,
-                                        new_run_timestamp)) # Pass timestamp for new crawls
+                                        new_run_timestamp, # Pass timestamp for new crawls
+                                        rewrite_rules,
+                                        form_analysis_mode,
+                                        form_skip_pixel_on_dom_match,
+                                        mask_rules,
+                                        form_use_decoded_cache,
+                                        capture_matrix))
         thread.start()
         return redirect(url_for("index"))
 
@@ -162,13 +187,68 @@ def index():
         form_url2=form_url2,
         selected_existing_crawl1=selected_existing_crawl1,
         selected_existing_crawl2=selected_existing_crawl2,
+        form_rewrite_rules=form_rewrite_rules,
+        form_analysis_mode=form_analysis_mode,
+        form_skip_pixel_on_dom_match=form_skip_pixel_on_dom_match,
+        form_mask_rules=form_mask_rules,
+        form_use_decoded_cache=form_use_decoded_cache,
+        form_capture_matrix=form_capture_matrix,
         available_crawls=available_crawls
     )
 
-def run_comparison_workflow(url1, site1_info, url2, site2_info, new_run_timestamp):
+def _resolve_screenshot_path(template_path):
+    """Maps a template path (relative to the screenshot folder) to a project-relative path inside it."""
+    base = os.path.abspath(app.config['UPLOAD_FOLDER'])
+    candidate = os.path.abspath(os.path.join(base, template_path))
+    if os.path.commonpath([base, candidate]) != base:
+        return None
+    return os.path.relpath(candidate)
+
+def _send_artifact(path, etag, max_age=3600):
+    if not path:
+        abort(404)
+    # Relative paths would be resolved against the app root, not the working directory
+    return send_file(os.path.abspath(path), mimetype="image/png", etag=etag, max_age=max_age)
+
+@app.route("/artifacts/thumbnail/<path:image_path>")
+def artifact_thumbnail(image_path):
+    source_path = _resolve_screenshot_path(image_path)
+    if source_path is None:
+        abort(404)
+    return _send_artifact(*artifacts.get_thumbnail(source_path))
+
+@app.route("/artifacts/<kind>/<int:result_index>")
+def artifact_comparison(kind, result_index):
+    if kind not in artifacts.COMPARISON_KINDS or not 0 <= result_index < len(comparison_results):
+        abort(404)
+    result = comparison_results[result_index]
+    viewport = request.args.get("viewport")
+    if viewport:  # One of the extra capture-matrix viewports of this result
+        result = next((vp for vp in result.get("viewports", []) if vp["viewport"] == viewport), None)
+        if result is None:
+            abort(404)
+    if not (result.get("img1_path") and result.get("img2_path")):
+        abort(404)
+    # The URL names a position in the latest results, not a pair, so browsers must
+    # revalidate (cheap: ETag/304) instead of reusing a previous run's image.
+    return _send_artifact(*artifacts.get_comparison_artifact(
+        kind, result["img1_path"], result["img2_path"],
+        result.get("mask_rects1"), result.get("mask_rects2"),
+        result.get("use_decoded_cache", False)), max_age=0)
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(instrumentation.render_prometheus(),
+                    mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+def run_comparison_workflow(url1, site1_info, url2, site2_info, new_run_timestamp, rewrite_rules=None, analysis_mode='standard',
+                            skip_pixel_on_dom_match=False, mask_rules=None,
+                            use_decoded_cache=False, capture_matrix=None):
     global comparison_results, crawl_status # Using global for simplicity
     pages1_data = None
     pages2_data = None
+    instrumentation.start_trace(os.path.join(app.config['UPLOAD_FOLDER'], "_traces",
+                                             f"trace_{new_run_timestamp}.jsonl"))
     
     try:
         # --- Website 1 Processing ---
@@ -177,10 +257,10 @@ def run_comparison_workflow(url1, site1_info, url2, site2_info, new_run_timestam
             site1_output_dir = os.path.join(app.config['UPLOAD_FOLDER'], site1_info['site_name_sanitized'], new_run_timestamp)
             os.makedirs(site1_output_dir, exist_ok=True)
             print(f"Starting FRESH CRAWL for Website 1 (Legacy): {url1} -> saving to {site1_output_dir}")
-            pages1_data = crawler.crawl_website(url1, site1_output_dir, is_modern_site=False) # output_dir_base is where it saves images
-            if pages1_data:
-                save_crawled_data(pages1_data, site1_output_dir) # Save metadata in the same folder
-            else:
+            pages1_data = crawler.crawl_website(url1, site1_output_dir, is_modern_site=False,
+                                                mask_rules=mask_rules,
+                                                capture_matrix=capture_matrix) # Saves images and manifest.jsonl in output_dir_base
+            if not pages1_data:
                 print(f"Warning: No pages_data returned from crawling {url1}")
         elif site1_info['action'] == 'load':
             # site1_info['path'] is 'site_name_folder/timestamp_folder'
@@ -197,10 +277,10 @@ def run_comparison_workflow(url1, site1_info, url2, site2_info, new_run_timestam
             site2_output_dir = os.path.join(app.config['UPLOAD_FOLDER'], site2_info['site_name_sanitized'], new_run_timestamp)
             os.makedirs(site2_output_dir, exist_ok=True)
             print(f"Starting FRESH CRAWL for Website 2 (Modern): {url2} -> saving to {site2_output_dir}")
-            pages2_data = crawler.crawl_website(url2, site2_output_dir, is_modern_site=True)
-            if pages2_data:
-                save_crawled_data(pages2_data, site2_output_dir)
-            else:
+            pages2_data = crawler.crawl_website(url2, site2_output_dir, is_modern_site=True,
+                                                mask_rules=mask_rules,
+                                                capture_matrix=capture_matrix)
+            if not pages2_data:
                 print(f"Warning: No pages_data returned from crawling {url2}")
         elif site2_info['action'] == 'load':
             full_load_path = os.path.join(app.config['UPLOAD_FOLDER'], site2_info['path'])
@@ -213,13 +293,18 @@ def run_comparison_workflow(url1, site1_info, url2, site2_info, new_run_timestam
 
         # --- Comparison ---
         print("Comparing pages...")
-        comparison_results = comparator.compare_pages(pages1_data, pages2_data, url1, url2)
+        metric_names, detail_metric_names = metrics.ANALYSIS_PRESETS[analysis_mode]
+        comparison_results = comparator.compare_pages(pages1_data, pages2_data, url1, url2, rewrite_rules,
+                                                      metric_names, detail_metric_names,
+                                                      skip_pixel_on_dom_match, mask_rules,
+                                                      use_decoded_cache)
         crawl_status["message"] = "Comparison finished successfully!"
 
     except Exception as e:
         print(f"ERROR during comparison workflow: {e}")
         crawl_status["message"] = f"Workflow Error: {str(e)}" # Display the error message
     finally:
+        instrumentation.stop_trace()
         crawl_status["running"] = False
 
 
@@ -0,0 +1,180 @@
+# artifacts.py
+import hashlib
+import json
+import os
+import threading
+import cv2
+import numpy as np
+from PIL import Image
+import comparator
+import instrumentation
+import metrics
+
+# Thumbnails, diff images and overlays are rendered on first request (see the
+# /artifacts routes in app.py) instead of during comparison runs, and cached on
+# disk under a content-derived key that doubles as the HTTP ETag. The cache is
+# evicted least-recently-used first once it grows past ARTIFACT_CACHE_MAX_BYTES.
+
+ARTIFACT_CACHE_DIR = os.path.join(comparator.BASE_SCREENSHOT_DIR_NAME, "_artifact_cache")
+ARTIFACT_CACHE_MAX_BYTES = 500 * 1024 * 1024
+ARTIFACT_CACHE_EVICT_TO_RATIO = 0.8  # Evict down to 80% of the limit, so eviction is infrequent
+THUMBNAIL_SIZE = (50, 100)
+
+COMPARISON_KINDS = ("diff", "heatmap", "side_by_side")
+SIDE_BY_SIDE_GAP = 10  # px
+
+# Running size of the cache in bytes, so stores don't have to walk the cache tree.
+# None until the first store (or eviction) scans it; corrected by every eviction scan.
+_cache_bytes = None
+_cache_bytes_lock = threading.Lock()
+
+
+def _cache_key(*parts):
+    """Key from source paths (with size and mtime, so changed sources miss) and options."""
+    items = []
+    for part in parts:
+        if isinstance(part, str) and os.path.isfile(part):
+            stat = os.stat(part)
+            items.append([os.path.abspath(part), stat.st_size, stat.st_mtime_ns])
+        else:
+            items.append(part)
+    return hashlib.sha1(json.dumps(items, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _cache_path(key):
+    return os.path.join(ARTIFACT_CACHE_DIR, key[:2], f"{key}.png")
+
+
+def _cache_lookup(key):
+    path = _cache_path(key)
+    if os.path.exists(path):
+        try:
+            os.utime(path)  # Mark as recently used for LRU eviction
+        except OSError:
+            pass
+        return path
+    return None
+
+
+def _cache_store(key, pil_image):
+    path = _cache_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with instrumentation.timed("artifact_write", artifact="cache"):
+        pil_image.save(tmp_path, format="PNG")
+        os.replace(tmp_path, path)  # Atomic, so concurrent requests never see partial files
+    global _cache_bytes
+    with _cache_bytes_lock:
+        if _cache_bytes is not None:
+            _cache_bytes += os.path.getsize(path)
+        needs_scan = _cache_bytes is None or _cache_bytes > ARTIFACT_CACHE_MAX_BYTES
+    if needs_scan:
+        evict_cache()
+    return path
+
+
+def evict_cache(max_bytes=ARTIFACT_CACHE_MAX_BYTES):
+    """Scans the cache and, if it is over max_bytes, removes least recently used files."""
+    global _cache_bytes
+    entries = []
+    total = 0
+    for root, _, files in os.walk(ARTIFACT_CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+    if total <= max_bytes:
+        with _cache_bytes_lock:
+            _cache_bytes = total
+        return 0
+    target = max_bytes * ARTIFACT_CACHE_EVICT_TO_RATIO
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError:
+            continue
+    with _cache_bytes_lock:
+        _cache_bytes = total
+    print(f"Artifact cache: evicted {removed} file(s), {total / (1024 * 1024):.1f} MB remain.")
+    return removed
+
+
+def get_thumbnail(source_path, size=THUMBNAIL_SIZE):
+    """Returns (cached_path, etag) for a thumbnail of source_path, or (None, None)."""
+    if not os.path.isfile(source_path):
+        return None, None
+    key = _cache_key("thumbnail", source_path, list(size))
+    cached = _cache_lookup(key)
+    if cached:
+        return cached, key
+    try:
+        with instrumentation.timed("artifact_render", artifact="thumbnail"):
+            img = Image.open(source_path)
+            img.thumbnail(size)
+        return _cache_store(key, img), key
+    except Exception as e:
+        print(f"Error creating thumbnail from '{source_path}': {e}")
+        return None, None
+
+
+def _render_comparison(kind, ctx):
+    if kind == "diff":
+        metrics.compute_metrics(ctx, ["pixel_diff"])
+        return Image.fromarray(ctx["threshold_img"])
+    if kind == "heatmap":
+        metrics.compute_metrics(ctx, ["ssim"])
+        dissimilarity = np.clip(1.0 - ctx["ssim_diff_map"], 0.0, 1.0)
+        heat = cv2.applyColorMap((dissimilarity * 255).astype(np.uint8), cv2.COLORMAP_JET)
+        base = cv2.cvtColor(ctx["gray1"], cv2.COLOR_GRAY2BGR)
+        blended = cv2.addWeighted(base, 0.5, heat, 0.5, 0)
+        return Image.fromarray(cv2.cvtColor(blended, cv2.COLOR_BGR2RGB))
+    if kind == "side_by_side":
+        left, right = ctx.get("rgb1", ctx["gray1"]), ctx.get("rgb2", ctx["gray2"])
+        gap_shape = (left.shape[0], SIDE_BY_SIDE_GAP) + left.shape[2:]
+        return Image.fromarray(np.hstack([left, np.full(gap_shape, 255, np.uint8), right]))
+    raise ValueError(f"Unknown comparison artifact kind: {kind}")
+
+
+def get_comparison_artifact(
+    kind, image_path1, image_path2, mask_rects1=None, mask_rects2=None, use_decoded_cache=False
+):
+    """
+    Returns (cached_path, etag) for a comparison image of the two screenshots:
+    'diff' (thresholded pixel diff), 'heatmap' (SSIM dissimilarity over image 1)
+    or 'side_by_side'. Masks and the decoded image cache are used as in comparison runs.
+    """
+    if kind not in COMPARISON_KINDS:
+        return None, None
+    if not (os.path.isfile(image_path1) and os.path.isfile(image_path2)):
+        return None, None
+    key = _cache_key(kind, image_path1, image_path2, mask_rects1 or [], mask_rects2 or [])
+    cached = _cache_lookup(key)
+    if cached:
+        return cached, key
+    try:
+        with instrumentation.timed("artifact_render", artifact=kind):
+            ctx = metrics.load_normalized_pair(
+                image_path1,
+                image_path2,
+                need_color=(kind == "side_by_side"),
+                use_decoded_cache=use_decoded_cache,
+            )
+            if ctx is None:
+                return None, None
+            metrics.apply_masks(ctx, mask_rects1, mask_rects2)
+            if ctx.get("fully_masked"):
+                return None, None
+            img = _render_comparison(kind, ctx)
+        return _cache_store(key, img), key
+    except Exception as e:
+        print(f"Error rendering '{kind}' for {os.path.basename(image_path1)} vs {os.path.basename(image_path2)}: {e}")
+        return None, None
@@ -0,0 +1,105 @@
+# benchmarks/fixture_site.py
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A locally served, fully deterministic website for driving crawler.crawl_website
+# offline. Pages are generated on request: /index.html links to the first pages,
+# and every page links to the next LINKS_PER_PAGE pages, so the crawler discovers
+# the whole site through normal link extraction.
+
+LINKS_PER_PAGE = 3
+DEFAULT_PAGE_COUNT = 20
+DEFAULT_PAGE_HEIGHT = 2000  # px
+DEFAULT_JS_WEIGHT_MS = 0  # Synchronous busy-loop per page, simulates heavy scripts
+
+
+def _page_path(index):
+    return "/index.html" if index == 0 else f"/page-{index}.html"
+
+
+def render_page(index, page_count, page_height, js_weight_ms):
+    links = "".join(
+        f'<li><a href="{_page_path(i)}">Page {i}</a></li>'
+        for i in range(index + 1, min(index + 1 + LINKS_PER_PAGE, page_count))
+    )
+    blocks = "".join(
+        f'<section class="block" style="height: 200px; background: hsl({(index * 37 + b * 53) % 360}, 60%, 80%);">'
+        f"<h2>Section {b}</h2><p>Fixture page {index}, block {b}. Lorem ipsum dolor sit amet.</p></section>"
+        for b in range(max(1, page_height // 250))
+    )
+    script = ""
+    if js_weight_ms > 0:
+        script = (
+            "<script>(function(){var end=Date.now()+" + str(int(js_weight_ms)) + ";"
+            "while(Date.now()<end){}})();</script>"
+        )
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="UTF-8"><title>Fixture Page {index}</title>
+<style>body {{ margin: 0; font-family: sans-serif; }} .block {{ margin: 25px; padding: 10px; }}</style>
+</head>
+<body style="min-height: {page_height}px;">
+<header id="alertBanner"><h1>Fixture Page {index}</h1></header>
+<nav><ul>{links}</ul></nav>
+<main>{blocks}</main>
+{script}
+</body>
+</html>"""
+
+
+def _make_handler(page_count, page_height, js_weight_ms, request_log):
+    class FixtureHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?", 1)[0].split("#", 1)[0]
+            index = None
+            if path in ("/", "/index.html"):
+                index = 0
+            elif path.startswith("/page-") and path.endswith(".html"):
+                try:
+                    index = int(path[len("/page-") : -len(".html")])
+                except ValueError:
+                    index = None
+            if index is None or not 0 <= index < page_count:
+                self.send_error(404)
+                return
+            body = render_page(index, page_count, page_height, js_weight_ms).encode("utf-8")
+            request_log.append(
+                {
+                    "time": time.perf_counter(),
+                    "path": path,
+                    "user_agent": self.headers.get("User-Agent", ""),
+                }
+            )
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Keep benchmark output readable
+
+    return FixtureHandler
+
+
+def start_fixture_site(
+    page_count=DEFAULT_PAGE_COUNT,
+    page_height=DEFAULT_PAGE_HEIGHT,
+    js_weight_ms=DEFAULT_JS_WEIGHT_MS,
+    host="127.0.0.1",
+    port=0,
+):
+    """
+    Starts the fixture site in a background thread.
+    Returns (server, base_url, request_log); call server.shutdown() when done.
+    """
+    request_log = []
+    server = ThreadingHTTPServer(
+        (host, port), _make_handler(page_count, page_height, js_weight_ms, request_log)
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}/"
+    print(f"Fixture site serving {page_count} pages at {base_url}")
+    return server, base_url, request_log
@@ -0,0 +1,339 @@
+# benchmarks/run_benchmarks.py
+"""
+Benchmark harness for the crawler and comparator. Run from the repository root:
+
+    python -m benchmarks.run_benchmarks compare [--preset standard] [--heights 1080,4000] [--check-pyramid]
+    python -m benchmarks.run_benchmarks crawl [--pages 20] [--page-height 2000] [--js-weight-ms 0]
+
+Reports throughput, per-item and per-stage latency percentiles (the latter from the
+run's instrumentation trace) and peak RSS. Add --save-baseline to store the results
+in benchmarks/baselines.json; later runs with the same configuration are checked
+against it and exit with status 1 on a regression larger than --tolerance (default 20%).
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+import comparator
+import instrumentation
+import metrics
+from benchmarks import fixture_site, synthetic_corpus
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+DEFAULT_TOLERANCE = 0.2
+
+# metric -> True if higher is better
+TRACKED_METRICS = {
+    "throughput_per_sec": True,
+    "item_latency_ms.p50": False,
+    "item_latency_ms.p90": False,
+    "peak_rss_mb": False,
+}
+
+
+def latency_percentiles(values_seconds):
+    if not values_seconds:
+        return None
+    values_ms = np.array(values_seconds) * 1000.0
+    return {
+        "count": int(values_ms.size),
+        "mean": float(values_ms.mean()),
+        "p50": float(np.percentile(values_ms, 50)),
+        "p90": float(np.percentile(values_ms, 90)),
+        "p99": float(np.percentile(values_ms, 99)),
+        "max": float(values_ms.max()),
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process (browser processes are not included)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def stage_latencies_from_trace(trace_path):
+    """
+    Per-stage latency percentiles from an instrumentation trace. Labelled stages are
+    reported separately, e.g. 'metric:ssim' for instrumentation.timed("metric", metric="ssim").
+    """
+    stage_times = {}
+    with open(trace_path, "r") as f:
+        for line in f:
+            event = json.loads(line)
+            if "stage" not in event:
+                continue  # Gauge sample
+            labels = [str(v) for k, v in sorted(event.items()) if k not in ("ts", "stage", "duration_ms")]
+            stage = ":".join([event["stage"]] + labels)
+            stage_times.setdefault(stage, []).append(event["duration_ms"] / 1000.0)
+    return {stage: latency_percentiles(times) for stage, times in stage_times.items()}
+
+
+def _start_bench_trace(directory):
+    trace_path = os.path.join(directory, "bench_trace.jsonl")
+    if os.path.exists(trace_path):
+        os.remove(trace_path)  # The trace is appended to, so start from an empty file
+    instrumentation.start_trace(trace_path)
+    return trace_path
+
+
+# --- Comparator benchmark ---
+def check_pyramid_accuracy(pages1_data, pages2_data):
+    """
+    Compares 'pyramid_ssim' with full-resolution SSIM on every pair. Returns per-decision
+    {count, max_abs_error, tolerance, within_tolerance}; pairs found identical
+    up front count as refined.
+    """
+    tolerances = {"refined": metrics.PYRAMID_SSIM_TOLERANCE, "sampled": metrics.PYRAMID_SAMPLED_SSIM_TOLERANCE}
+    errors = {decision: [] for decision in tolerances}
+    for norm_path, data1 in pages1_data.items():
+        ctx = metrics.load_normalized_pair(data1["img_path"], pages2_data[norm_path]["img_path"])
+        if ctx is None:
+            continue
+        pyramid = metrics.metric_pyramid_ssim(dict(ctx))
+        full_score = metrics.metric_ssim(dict(ctx))["ssim_score"]
+        decision = "sampled" if pyramid["pyramid_decision"] == "sampled" else "refined"
+        errors[decision].append(abs(pyramid["ssim_score"] - full_score))
+    return {
+        decision: {
+            "count": len(values),
+            "max_abs_error": max(values) if values else None,
+            "tolerance": tolerances[decision],
+            "within_tolerance": all(v <= tolerances[decision] for v in values),
+        }
+        for decision, values in errors.items()
+    }
+
+
+def bench_compare(args):
+    metric_names, detail_metric_names = metrics.ANALYSIS_PRESETS[args.preset]
+    pages1_data, pages2_data = synthetic_corpus.generate_corpus(
+        output_dir=args.corpus_dir,
+        seed=args.seed,
+        widths=args.widths,
+        heights=args.heights,
+        pairs_per_combo=args.pairs_per_combo,
+    )
+
+    # Throughput, per-pair and per-stage latencies all come from this one run
+    print(f"Timing compare_pages with preset '{args.preset}'...")
+    trace_path = _start_bench_trace(os.path.join(args.corpus_dir, f"seed_{args.seed}"))
+    try:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = comparator.compare_pages(
+                pages1_data, pages2_data, "synthetic://a/", "synthetic://b/",
+                metric_names=metric_names, detail_metric_names=detail_metric_names,
+            )
+        elapsed = time.perf_counter() - start
+    finally:
+        instrumentation.stop_trace()
+    stage_latency_ms = stage_latencies_from_trace(trace_path)
+
+    report = {
+        "benchmark": "compare",
+        "config": {
+            "preset": args.preset,
+            "seed": args.seed,
+            "widths": list(args.widths),
+            "heights": list(args.heights),
+            "pairs_per_combo": args.pairs_per_combo,
+        },
+        "items": len(results),
+        "elapsed_sec": elapsed,
+        "throughput_per_sec": len(results) / elapsed if elapsed > 0 else None,
+        "item_latency_ms": stage_latency_ms.pop("pair_analysis", None),
+        "stage_latency_ms": stage_latency_ms,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if args.check_pyramid:
+        print("Checking pyramid_ssim against full-resolution SSIM...")
+        report["pyramid_check"] = check_pyramid_accuracy(pages1_data, pages2_data)
+    return report
+
+
+# --- Crawler benchmark ---
+def bench_crawl(args):
+    import crawler  # Imported here so the compare benchmark does not need Selenium
+
+    server, base_url, request_log = fixture_site.start_fixture_site(
+        page_count=args.pages, page_height=args.page_height, js_weight_ms=args.js_weight_ms
+    )
+    output_dir = os.path.join(
+        "screenshots", "_benchmark_crawl", datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    )
+    os.makedirs(output_dir, exist_ok=True)
+    trace_path = _start_bench_trace(output_dir)
+    try:
+        start = time.perf_counter()
+        pages_data = crawler.crawl_website(base_url, output_dir, is_modern_site=False)
+        elapsed = time.perf_counter() - start
+    finally:
+        instrumentation.stop_trace()
+        server.shutdown()
+
+    # Per-page latency: time between consecutive browser navigations to the fixture site
+    browser_hits = [entry["time"] for entry in request_log if "Chrome" in entry["user_agent"]]
+    page_times = [b - a for a, b in zip(browser_hits, browser_hits[1:])]
+
+    return {
+        "benchmark": "crawl",
+        "config": {
+            "pages": args.pages,
+            "page_height": args.page_height,
+            "js_weight_ms": args.js_weight_ms,
+        },
+        "items": len(pages_data),
+        "elapsed_sec": elapsed,
+        "throughput_per_sec": len(pages_data) / elapsed if elapsed > 0 else None,
+        "item_latency_ms": latency_percentiles(page_times),
+        "stage_latency_ms": stage_latencies_from_trace(trace_path),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+# --- Baselines ---
+def _baseline_key(report):
+    return report["benchmark"] + ":" + json.dumps(report["config"], sort_keys=True)
+
+
+def _get_metric(report, dotted_name):
+    value = report
+    for part in dotted_name.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def load_baselines(path=BASELINES_PATH):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except json.JSONDecodeError:
+        print(f"Warning: Baselines file {path} is not valid JSON; ignoring it.")
+        return {}
+
+
+def save_baseline(report, path=BASELINES_PATH):
+    baselines = load_baselines(path)
+    baselines[_baseline_key(report)] = report
+    with open(path, "w") as f:
+        json.dump(baselines, f, indent=4, sort_keys=True)
+    print(f"Baseline saved to {path}")
+
+
+def find_regressions(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    regressions = []
+    for name, higher_is_better in TRACKED_METRICS.items():
+        current, previous = _get_metric(report, name), _get_metric(baseline, name)
+        if current is None or not previous:
+            continue
+        change = (current - previous) / previous
+        if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+            regressions.append(f"{name}: {previous:.2f} -> {current:.2f} ({change:+.0%})")
+    return regressions
+
+
+def print_report(report):
+    print(f"\n=== {report['benchmark']} benchmark ===")
+    print(f"Config: {json.dumps(report['config'], sort_keys=True)}")
+    print(f"Items: {report['items']} in {report['elapsed_sec']:.2f}s "
+          f"({report['throughput_per_sec'] or 0:.2f}/sec)")
+    if report["peak_rss_mb"] is not None:
+        print(f"Peak RSS: {report['peak_rss_mb']:.1f} MB")
+    for decision, check in sorted(report.get("pyramid_check", {}).items()):
+        if check["count"]:
+            print(f"Pyramid vs full SSIM ({decision}): {check['count']} pairs, max error "
+                  f"{check['max_abs_error']:.4f} (tolerance {check['tolerance']}) "
+                  f"{'OK' if check['within_tolerance'] else 'EXCEEDED'}")
+    rows = [("per item", report["item_latency_ms"])] + sorted(report["stage_latency_ms"].items())
+    print(f"{'stage':<28}{'count':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage, pct in rows:
+        if pct:
+            print(f"{stage:<28}{pct['count']:>7}{pct['p50']:>10.1f}{pct['p90']:>10.1f}"
+                  f"{pct['p99']:>10.1f}{pct['max']:>10.1f}")
+
+
+def _int_list(value):
+    return tuple(int(v) for v in value.split(",") if v.strip())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crawler/comparator benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    compare_parser = subparsers.add_parser("compare", help="Benchmark the comparator on a synthetic corpus")
+    compare_parser.add_argument("--preset", choices=sorted(metrics.ANALYSIS_PRESETS), default="standard")
+    compare_parser.add_argument("--seed", type=int, default=0)
+    compare_parser.add_argument("--widths", type=_int_list, default=synthetic_corpus.DEFAULT_WIDTHS)
+    compare_parser.add_argument("--heights", type=_int_list, default=synthetic_corpus.DEFAULT_HEIGHTS)
+    compare_parser.add_argument("--pairs-per-combo", type=int, default=1)
+    compare_parser.add_argument("--corpus-dir", default=synthetic_corpus.DEFAULT_CORPUS_DIR)
+    compare_parser.add_argument("--check-pyramid", action="store_true",
+                                help="Fail if pyramid_ssim strays from full SSIM beyond its tolerances")
+
+    crawl_parser = subparsers.add_parser("crawl", help="Benchmark the crawler on the local fixture site")
+    crawl_parser.add_argument("--pages", type=int, default=fixture_site.DEFAULT_PAGE_COUNT)
+    crawl_parser.add_argument("--page-height", type=int, default=fixture_site.DEFAULT_PAGE_HEIGHT)
+    crawl_parser.add_argument("--js-weight-ms", type=int, default=fixture_site.DEFAULT_JS_WEIGHT_MS)
+
+    for sub in (compare_parser, crawl_parser):
+        sub.add_argument("--save-baseline", action="store_true", help="Store results as the new baseline")
+        sub.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+        sub.add_argument("--output", help="Also write the JSON report to this file")
+
+    args = parser.parse_args(argv)
+    report = bench_compare(args) if args.benchmark == "compare" else bench_crawl(args)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+    if report["benchmark"] == "compare" and report["item_latency_ms"] is None:
+        # compare_pages only analyses images it can serve, i.e. ones under the screenshots folder
+        print(f"NO PAIRS WERE ANALYSED; is --corpus-dir inside the '{comparator.BASE_SCREENSHOT_DIR_NAME}' folder?")
+        return 1
+
+    pyramid_failures = [
+        decision for decision, check in report.get("pyramid_check", {}).items() if not check["within_tolerance"]
+    ]
+    if pyramid_failures:
+        print(f"PYRAMID SSIM OUT OF TOLERANCE for {', '.join(pyramid_failures)} pairs.")
+        return 1
+
+    if args.save_baseline:
+        save_baseline(report)
+        return 0
+    baseline = load_baselines().get(_baseline_key(report))
+    if baseline is None:
+        print("No baseline stored for this configuration (use --save-baseline).")
+        return 0
+    regressions = find_regressions(report, baseline, args.tolerance)
+    if regressions:
+        print("REGRESSIONS against baseline:")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+    print(f"No regressions against baseline (tolerance {args.tolerance:.0%}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+# benchmarks/synthetic_corpus.py
+import os
+import zlib
+import cv2
+import numpy as np
+from PIL import Image
+
+# Generates pairs of page-like screenshots with controlled differences, for driving
+# comparator.compare_pages and analyze_pixel_and_structural_differences without a
+# browser. The same seed always produces the same corpus.
+
+# Must live under comparator.BASE_SCREENSHOT_DIR_NAME so compare_pages accepts the paths
+DEFAULT_CORPUS_DIR = os.path.join("screenshots", "_benchmark_corpus")
+DIFF_KINDS = (
+    "identical",
+    "text_change",
+    "block_shift",
+    "color_shift",
+    "different",
+    "inverted",
+    "noise",
+    "antialias",
+)
+NOISE_AMPLITUDE = 6  # Grey levels; rendering/compression noise invisible at low resolution
+DEFAULT_WIDTHS = (1280, 1920)
+DEFAULT_HEIGHTS = (1080, 4000, 10000)
+
+
+def render_synthetic_page(rng, width, height):
+    img = np.full((height, width, 3), 245, np.uint8)
+    cv2.rectangle(img, (0, 0), (width, 100), (40, 60, 90), -1)  # Header bar
+    y = 140
+    while y < height - 80:
+        if rng.random() < 0.25:
+            block_h = int(rng.integers(120, 400))
+            color = tuple(int(c) for c in rng.integers(60, 230, 3))
+            x0 = int(rng.integers(20, max(21, width // 3)))
+            cv2.rectangle(img, (x0, y), (min(width - 20, x0 + width // 2), y + block_h), color, -1)
+            y += block_h + 30
+        else:
+            words = " ".join("lorem ipsum dolor sit amet".split()[: int(rng.integers(2, 6))])
+            cv2.putText(img, words, (40, y), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (30, 30, 30), 2)
+            y += 45
+    return img
+
+
+def apply_diff(rng, img, kind):
+    height, width = img.shape[:2]
+    if kind == "identical":
+        return img.copy()
+    if kind == "text_change":
+        changed = img.copy()
+        y = int(rng.integers(150, max(151, height - 100)))
+        cv2.rectangle(changed, (30, y - 35), (min(width, 900), y + 10), (245, 245, 245), -1)
+        cv2.putText(changed, "changed copy text", (40, y), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (30, 30, 30), 2)
+        return changed
+    if kind == "block_shift":
+        return np.roll(img, int(rng.integers(10, 40)), axis=0)
+    if kind == "color_shift":
+        return cv2.add(img, np.full(img.shape, 12, np.uint8))
+    if kind == "different":
+        return render_synthetic_page(rng, width, height)
+    if kind == "inverted":  # Dark-mode style redesign: decisively different at every scale
+        return cv2.bitwise_not(img)
+    if kind == "noise":
+        noise = rng.integers(-NOISE_AMPLITUDE, NOISE_AMPLITUDE + 1, img.shape)
+        return np.clip(img.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+    if kind == "antialias":  # Half-pixel resampling, like a different font rasterizer
+        shift = np.float32([[1, 0, 0.5], [0, 1, 0]])
+        return cv2.warpAffine(img, shift, (width, height), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+    raise ValueError(f"Unknown diff kind: {kind}")
+
+
+def generate_corpus(
+    output_dir=DEFAULT_CORPUS_DIR,
+    seed=0,
+    kinds=DIFF_KINDS,
+    widths=DEFAULT_WIDTHS,
+    heights=DEFAULT_HEIGHTS,
+    pairs_per_combo=1,
+):
+    """
+    Writes image pairs for every kind x width x height combination and returns
+    (pages1_data, pages2_data) in the crawler's pages_data format, keyed by a
+    shared normalized path so compare_pages pairs them exactly.
+    """
+    corpus_dir = os.path.join(output_dir, f"seed_{seed}")
+    os.makedirs(corpus_dir, exist_ok=True)
+    pages1_data = {}
+    pages2_data = {}
+    for kind in kinds:
+        for width in widths:
+            for height in heights:
+                for n in range(pairs_per_combo):
+                    name = f"{kind}-{width}x{height}-{n}"
+                    # Seeded per pair, so cached pairs and regenerated ones always agree
+                    rng = np.random.default_rng([seed, zlib.crc32(name.encode("utf-8"))])
+                    path1 = os.path.join(corpus_dir, f"{name}_a.png")
+                    path2 = os.path.join(corpus_dir, f"{name}_b.png")
+                    if not (os.path.exists(path1) and os.path.exists(path2)):
+                        img1 = render_synthetic_page(rng, width, height)
+                        img2 = apply_diff(rng, img1, kind)
+                        Image.fromarray(img1).save(path1)
+                        Image.fromarray(img2).save(path2)
+                    pages1_data[name] = {"img_path": path1, "title": name, "full_url": f"synthetic://a/{name}"}
+                    pages2_data[name] = {"img_path": path2, "title": name, "full_url": f"synthetic://b/{name}"}
+    print(f"Synthetic corpus ready: {len(pages1_data)} pairs in {corpus_dir}")
+    return pages1_data, pages2_data
@@ -1,131 +1,96 @@
 # comparator.py
 from skimage.metrics import structural_similarity as ssim
-import cv2
 from PIL import Image
 import numpy as np
 import os
 import time
+from urllib.parse import urlparse
+import dom_diff
+import instrumentation
+import masks
+import metrics
+import path_matcher
 
 # This constant MUST match the value of static_folder in app.py's Flask constructor
 # AND app.config['UPLOAD_FOLDER']. It's the root directory for all screenshot data.
 BASE_SCREENSHOT_DIR_NAME = "screenshots"
-MAX_COMPARISON_DIMENSION = 1920  # For resizing images before SSIM
-
-MIN_CONTOUR_AREA = 100
-PIXEL_DIFF_THRESHOLD = 30
+MAX_COMPARISON_DIMENSION = metrics.MAX_COMPARISON_DIMENSION  # For resizing images before SSIM
+# Pages judged unchanged without computing SSIM rank alongside perfect matches
+UNSCORED_MATCH_CLASSIFICATIONS = ("Not Flagged", "DOM Match")
 
 
 def analyze_pixel_and_structural_differences(
-    image_path1, image_path2, diff_image_save_rel_path=None
+    image_path1,
+    image_path2,
+    diff_image_save_rel_path=None,
+    metric_names=None,
+    detail_metric_names=None,
+    mask_rects1=None,
+    mask_rects2=None,
+    use_decoded_cache=False,
 ):
     """
-    Compares two images using SSIM and also calculates pixel difference percentage,
-    and saves a visual diff image.
+    Compares two images with the selected metrics (see metrics.METRICS) and
+    saves a visual diff image.
     diff_image_save_rel_path: Project-relative path to save the diff image,
                               e.g., 'screenshots/site_name/timestamp/diff_page.png'
+    metric_names: Metrics computed for every pair (default: metrics.DEFAULT_METRICS)
+    detail_metric_names: Metrics computed only if the first pass flags the pair
+                         as different (see metrics.is_flagged)
+    mask_rects1/mask_rects2: [x, y, w, h] page regions of each image to ignore;
+                             fully masked rows are also left out of the diff image
+    use_decoded_cache: Reuse memory-mapped decoded image arrays (see image_cache.py)
     """
+    metric_names = tuple(metric_names or metrics.DEFAULT_METRICS)
+    detail_metric_names = tuple(detail_metric_names or ())
     analysis_results = {
         "ssim_score": None,
         "diff_percent": None,
         "num_significant_diff_regions": 0,
-        "largest_diff_area_percent": None,  # Placeholder for future contour analysis
+        "largest_diff_region_area_percent": None,
+        "ms_ssim_score": None,
+        "phash_distance": None,
+        "color_delta": None,
+        "edge_diff_percent": None,
+        "flagged": None,  # None when no triage pass was requested
+        "pyramid_decision": None,  # Set by the coarse-to-fine 'pyramid_ssim' metric
+        "pyramid_estimate_margin": None,  # Confidence margin when the SSIM score is a sampled estimate
+        "diff_regions": [],  # Bounding boxes of the largest diff regions, image 1 page coordinates
+        "diff_regions2": [],  # The same regions in image 2 page coordinates
         "diff_image_template_path": None,  # For url_for in template
     }
 
     try:
-        pil_img1_orig = Image.open(image_path1)
-        pil_img2_orig = Image.open(image_path2)
-
-        # --- Convert to Grayscale and Resize for SSIM and Diff ---
-        # Reusing similar resizing logic from your existing compare_images_ssim
-        # Ensure pil_img1 and pil_img2 are the resized grayscale PIL images of the same dimensions
-        pil_img1 = pil_img1_orig.convert("L")
-        pil_img2 = pil_img2_orig.convert("L")
-
-        w1, h1 = pil_img1.size
-        w2, h2 = pil_img2.size
-
-        if (
-            w1 != w2
-            or h1 != h2
-            or w1 > MAX_COMPARISON_DIMENSION
-            or h1 > MAX_COMPARISON_DIMENSION
-            or w2 > MAX_COMPARISON_DIMENSION
-            or h2 > MAX_COMPARISON_DIMENSION
-        ):
-            target_w = min(w1, w2, MAX_COMPARISON_DIMENSION)
-            r1 = target_w / float(w1) if w1 > 0 else 0
-            th1 = int(h1 * r1)
-            r2 = target_w / float(w2) if w2 > 0 else 0
-            th2 = int(h2 * r2)
-
-            if w1 != target_w or h1 != th1:
-                pil_img1 = pil_img1.resize(
-                    (max(1, target_w), max(1, th1)), Image.LANCZOS
-                )
-            if w2 != target_w or h2 != th2:
-                pil_img2 = pil_img2.resize(
-                    (max(1, target_w), max(1, th2)), Image.LANCZOS
-                )
-
-            final_h = min(pil_img1.height, pil_img2.height)
-            final_w = pil_img1.width  # Widths should be same now
-            if pil_img1.height != final_h:
-                pil_img1 = pil_img1.resize((final_w, final_h), Image.LANCZOS)
-            if pil_img2.height != final_h:
-                pil_img2 = pil_img2.resize((final_w, final_h), Image.LANCZOS)
-
-        gray1_np = np.array(pil_img1)  # Already grayscale PIL image
-        gray2_np = np.array(pil_img2)
-
-        if gray1_np.shape != gray2_np.shape:
-            print(
-                f"  ERROR: Shape mismatch for diff analysis after resize: {gray1_np.shape} vs {gray2_np.shape}"
-            )
+        need_color = any(
+            name in metrics.NEEDS_COLOR for name in metric_names + detail_metric_names
+        )
+        # load_normalized_pair times its own 'decode' and 'resize' stages
+        ctx = metrics.load_normalized_pair(
+            image_path1, image_path2, need_color=need_color, use_decoded_cache=use_decoded_cache
+        )
+        if ctx is None:
             return analysis_results  # Return defaults
-
-        # 1. SSIM Score
-        score, ssim_diff_map = ssim(
-            gray1_np, gray2_np, full=True
-        )  # Get full diff map if needed later
-        analysis_results["ssim_score"] = score
-
-        # 2. Pixel Difference Percentage
-        abs_diff_img = cv2.absdiff(gray1_np, gray2_np)
-        # Threshold needs tuning: lower is more sensitive. Start with 25-35.
-        _, threshold_img = cv2.threshold(abs_diff_img, PIXEL_DIFF_THRESHOLD, 255, cv2.THRESH_BINARY)
-
-        img_h, img_w = threshold_img.shape
-        total_pixels_in_image = img_h * img_w
-        diff_pixels = cv2.countNonZero(threshold_img)
-        analysis_results["diff_percent"] = (diff_pixels / total_pixels_in_image) * 100 if total_pixels_in_image > 0 else 0
-
-        # 3. Contour Analysis on the threshold_img
-        # Use threshold_img.copy() if findContours modifies the source (depends on OpenCV version)
-        contours, _ = cv2.findContours(threshold_img.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        significant_contours = []
-        if contours:
-            for contour in contours:
-                area = cv2.contourArea(contour)
-                if area >= MIN_CONTOUR_AREA:
-                    significant_contours.append(contour)
-            
-            analysis_results["num_significant_diff_regions"] = len(significant_contours)
-            
-            if significant_contours:
-                largest_contour = max(significant_contours, key=cv2.contourArea)
-                largest_area = cv2.contourArea(largest_contour)
-                analysis_results["largest_diff_region_area_percent"] = \
-                    (largest_area / total_pixels_in_image) * 100 if total_pixels_in_image > 0 else 0.0
-        
-        # 4. Save Visual Difference Image (the thresholded one)
-        if diff_image_save_rel_path:
+        with instrumentation.timed("apply_masks"):
+            metrics.apply_masks(ctx, mask_rects1, mask_rects2)
+        if ctx.get("fully_masked"):
+            print("  Pages are fully masked; nothing to compare.")
+            return analysis_results
+
+        analysis_results.update(metrics.compute_metrics(ctx, metric_names))
+        if detail_metric_names:
+            analysis_results["flagged"] = metrics.is_flagged(analysis_results)
+            if analysis_results["flagged"]:
+                remaining = [n for n in detail_metric_names if n not in metric_names]
+                analysis_results.update(metrics.compute_metrics(ctx, remaining))
+
+        # Save Visual Difference Image (the thresholded one)
+        if diff_image_save_rel_path and "threshold_img" in ctx:
             abs_save_path = os.path.abspath(diff_image_save_rel_path) # Already project-relative
             try:
                 os.makedirs(os.path.dirname(abs_save_path), exist_ok=True)
                 # Save the threshold_img (black and white diff)
-                Image.fromarray(threshold_img).save(abs_save_path) # Use Pillow to save to handle paths easily
+                with instrumentation.timed("artifact_write", artifact="diff"):
+                    Image.fromarray(ctx["threshold_img"]).save(abs_save_path) # Use Pillow to save to handle paths easily
                 analysis_results["diff_image_template_path"] = _get_path_for_template(diff_image_save_rel_path)
                 print(f"  Visual difference image saved: {abs_save_path}")
             except Exception as e_save:
@@ -158,25 +123,6 @@ def _get_path_for_template(project_relative_path):
         return None
 
 
-def create_thumbnail(source_project_rel_path, thumb_project_rel_path, size=(50, 100)):
-    try:
-        abs_source_path = os.path.abspath(source_project_rel_path)
-        abs_thumb_save_path = os.path.abspath(thumb_project_rel_path)
-        os.makedirs(os.path.dirname(abs_thumb_save_path), exist_ok=True)
-        img = Image.open(abs_source_path)
-        img.thumbnail(size)
-        img.save(abs_thumb_save_path)
-        return _get_path_for_template(thumb_project_rel_path)
-    except FileNotFoundError:
-        print(
-            f"Error creating thumbnail: Source not found at '{source_project_rel_path}'"
-        )
-        return None
-    except Exception as e:
-        print(f"Error creating thumbnail from '{source_project_rel_path}': {e}")
-        return None
-
-
 # (compare_images_ssim function - use the robust one from previous answers that handles resizing)
 def compare_images_ssim(image_path1, image_path2):
     # This is the robust version from previous answers that handles resizing and errors
@@ -267,39 +213,155 @@ def get_ssim_classification(score):
         return {"text": "Low Similarity", "range_display": "(<= 0.60)"}
 
 
-def compare_pages(pages1_data, pages2_data, base_url1, base_url2):
+def _compare_dom_snapshots(data1, data2):
+    if not (data1.get("dom_path") and data2.get("dom_path")):
+        return None
+    snapshot1 = dom_diff.load_dom_snapshot(data1["dom_path"])
+    snapshot2 = dom_diff.load_dom_snapshot(data2["dom_path"])
+    if snapshot1 is None or snapshot2 is None:
+        return None
+    return dom_diff.diff_dom_snapshots(snapshot1, snapshot2)
+
+
+def _compare_viewports(
+    data1,
+    data2,
+    metric_names,
+    detail_metric_names,
+    use_decoded_cache,
+):
+    """
+    Compares the extra viewport screenshots (see crawler.parse_capture_matrix) that
+    both pages were captured at. Only masks resolved from selectors at each width
+    apply here; fixed rect masks are in primary-viewport coordinates.
+    """
+    viewports1 = data1.get("viewports") or {}
+    viewports2 = data2.get("viewports") or {}
+    viewport_results = []
+    for key, vp1 in viewports1.items():
+        vp2 = viewports2.get(key)
+        if not vp2 or not (os.path.exists(vp1["img_path"]) and os.path.exists(vp2["img_path"])):
+            continue
+        with instrumentation.timed("viewport_analysis", viewport=key):
+            analysis = analyze_pixel_and_structural_differences(
+                vp1["img_path"],
+                vp2["img_path"],
+                None,
+                metric_names,
+                detail_metric_names,
+                vp1.get("mask_rects", []),
+                vp2.get("mask_rects", []),
+                use_decoded_cache,
+            )
+        classification = get_ssim_classification(analysis["ssim_score"])
+        if analysis["ssim_score"] is None and analysis["flagged"] is False:
+            classification = {"text": "Not Flagged", "range_display": "(Passed triage metrics)"}
+        viewport_results.append(
+            {
+                "viewport": key,
+                "img1_full": _get_path_for_template(vp1["img_path"]),
+                "img2_full": _get_path_for_template(vp2["img_path"]),
+                "img1_path": vp1["img_path"],
+                "img2_path": vp2["img_path"],
+                "mask_rects1": vp1.get("mask_rects", []),
+                "mask_rects2": vp2.get("mask_rects", []),
+                "use_decoded_cache": use_decoded_cache,
+                "score": analysis["ssim_score"],
+                "ssim_classification_text": classification["text"],
+                "diff_percent": analysis["diff_percent"],
+                "num_significant_diff_regions": analysis["num_significant_diff_regions"],
+                "flagged": analysis["flagged"],
+            }
+        )
+        print(f"  Viewport {key}: SSIM {analysis['ssim_score'] if analysis['ssim_score'] is not None else 'N/A'} "
+              f"({classification['text']}), Diff %: {_format_percent(analysis['diff_percent'])}")
+    return viewport_results
+
+
+def _format_percent(value):
+    return f"{value:.2f}%" if value is not None else "N/A"
+
+
+def _result_sort_key(result):
+    score = result["score"]
+    if score is None and result.get("ssim_classification_text") in UNSCORED_MATCH_CLASSIFICATIONS:
+        score = 1.0
+    return (score is not None, score if score is not None else -1)
+
+
+def compare_pages(
+    pages1_data,
+    pages2_data,
+    base_url1,
+    base_url2,
+    rewrite_rules=None,
+    metric_names=None,
+    detail_metric_names=None,
+    skip_pixel_on_dom_match=False,
+    mask_rules=None,
+    use_decoded_cache=False,
+):
     results = []
-    all_normalized_paths = sorted(
-        list(set(pages1_data.keys()) | set(pages2_data.keys()))
-    )
-    total_paths = len(all_normalized_paths)
+    domain1 = urlparse(base_url1).netloc if base_url1 else None
+    domain2 = urlparse(base_url2).netloc if base_url2 else None
+    with instrumentation.timed("path_matching"):
+        matches = path_matcher.match_pages(pages1_data, pages2_data, rewrite_rules)
+    total_paths = len(matches)
     print(f"\nStarting comparison of {total_paths} unique page paths...")
 
-    for i, norm_path in enumerate(all_normalized_paths):
-        # ... (result_entry initialization, title, url, and thumbnail path generation as before) ...
-        print(f"\n--- Comparing page {i + 1}/{total_paths}: '{norm_path}' ---")
-        data1 = pages1_data.get(norm_path)
-        data2 = pages2_data.get(norm_path)
+    for i, match in enumerate(matches):
+        # ... (result_entry initialization, title, url and image path generation as before) ...
+        norm_path = match["path1"] if match["path1"] is not None else match["path2"]
+        if match["method"] in ("rule", "fuzzy"):
+            print(
+                f"\n--- Comparing page {i + 1}/{total_paths}: '{match['path1']}' -> '{match['path2']}' "
+                f"({match['method']}, confidence {match['confidence']:.2f}) ---"
+            )
+        else:
+            print(f"\n--- Comparing page {i + 1}/{total_paths}: '{norm_path}' ---")
+        data1 = pages1_data.get(match["path1"]) if match["path1"] is not None else None
+        data2 = pages2_data.get(match["path2"]) if match["path2"] is not None else None
+        instrumentation.set_gauge("compare_queue_depth", total_paths - i)
+        instrumentation.sample_memory()
 
         result_entry = {
             "normalized_path": norm_path,
+            "normalized_path2": match["path2"],
+            "match_method": match["method"],
+            "match_confidence": match["confidence"],
             "title1": "N/A",
             "title2": "N/A",
             "full_url1": "#",
             "full_url2": "#",
             "img1_full": None,
-            "img1_thumb": None,
             "img2_full": None,
-            "img2_thumb": None,
+            # Thumbnails, diffs and overlays are rendered on demand (see artifacts.py);
+            # these are what the renderer needs to reproduce the comparison.
+            "img1_path": None,
+            "img2_path": None,
+            "mask_rects1": [],
+            "mask_rects2": [],
+            "use_decoded_cache": use_decoded_cache,
             "score": None,
             "ssim_classification_text": "N/A",
             "ssim_classification_range": "",
             "diff_percent": None,
             "num_significant_diff_regions": 0,
             "largest_diff_region_area_percent": 0.0,
-            "diff_image_template_path": None,  # New fields
+            "ms_ssim_score": None,
+            "phash_distance": None,
+            "color_delta": None,
+            "edge_diff_percent": None,
+            "flagged": None,
+            "pyramid_decision": None,
+            "pyramid_estimate_margin": None,
+            "dom_counts": None,  # Per-type counts of DOM changes, if both pages have snapshots
+            "dom_structure_match": None,
+            "dom_explanations": [],  # Changed elements overlapping pixel diff regions
+            "viewport": data1.get("viewport") if data1 else None,
+            "viewports": [],  # Results for the extra capture-matrix viewports both pages share
         }
-        # ... (Populate titles, full_urls, imgX_full, imgX_thumb paths using _get_path_for_template as before)
+        # ... (Populate titles, full_urls, imgX_full paths using _get_path_for_template as before)
         if data1:
             result_entry.update(
                 {
@@ -318,68 +380,89 @@ def compare_pages(pages1_data, pages2_data, base_url1, base_url2):
         if data1 and data1.get("img_path"):
             if os.path.exists(data1["img_path"]):
                 result_entry["img1_full"] = _get_path_for_template(data1["img_path"])
-                thumb_filename = "thumb_" + os.path.basename(data1["img_path"])
-                thumb_project_rel_path = os.path.join(
-                    os.path.dirname(data1["img_path"]), thumb_filename
-                )
-                result_entry["img1_thumb"] = create_thumbnail(
-                    data1["img_path"], thumb_project_rel_path
-                )
+                result_entry["img1_path"] = data1["img_path"]
         if data2 and data2.get("img_path"):
             if os.path.exists(data2["img_path"]):
                 result_entry["img2_full"] = _get_path_for_template(data2["img_path"])
-                thumb_filename = "thumb_" + os.path.basename(data2["img_path"])
-                thumb_project_rel_path = os.path.join(
-                    os.path.dirname(data2["img_path"]), thumb_filename
-                )
-                result_entry["img2_thumb"] = create_thumbnail(
-                    data2["img_path"], thumb_project_rel_path
-                )
+                result_entry["img2_path"] = data2["img_path"]
 
         if result_entry["img1_full"] and result_entry["img2_full"]:
-            print(f"  Analyzing differences for '{norm_path}'...")
-            start_time = time.time()
-
-            # Construct path to save diff image
-            # It will be saved relative to project root, e.g., screenshots/site1_name/timestamp/diff_norm_path.png
-            diff_img_filename = f"diff_{norm_path.replace('/', '_')}_{os.path.basename(data1['img_path'])}.png"
-            diff_image_save_location = None
-            if data1 and data1.get("img_path"):  # Use first image's directory structure
-                diff_image_save_location = os.path.join(
-                    os.path.dirname(data1["img_path"]), diff_img_filename
-                )
-
-            analysis = analyze_pixel_and_structural_differences(
-                data1["img_path"],  # Original project-relative path
-                data2["img_path"],  # Original project-relative path
-                diff_image_save_location,
+            result_entry["mask_rects1"] = data1.get("mask_rects", []) + masks.rects_for_page(
+                mask_rules or [], "legacy", domain1, match["path1"]
             )
-            end_time = time.time()
-            print(
-                f"  Analysis for '{norm_path}' took {end_time - start_time:.2f} seconds."
+            result_entry["mask_rects2"] = data2.get("mask_rects", []) + masks.rects_for_page(
+                mask_rules or [], "modern", domain2, match["path2"]
             )
-
-            result_entry["score"] = analysis["ssim_score"]
-            result_entry["diff_percent"] = analysis["diff_percent"]
-            result_entry["num_significant_diff_regions"] = analysis["num_significant_diff_regions"]
-            result_entry["largest_diff_region_area_percent"] = analysis["largest_diff_region_area_percent"]
-            result_entry["diff_image_template_path"] = analysis[
-                "diff_image_template_path"
-            ]
-
-            classification = get_ssim_classification(analysis["ssim_score"])
-            result_entry["ssim_classification_text"] = classification["text"]
-            result_entry["ssim_classification_range"] = classification[
-                "range_display"
-            ]  # Keep this for now, can be removed from display later if not needed
-
-            if analysis["ssim_score"] is not None:
-                print(f"  SSIM: {analysis['ssim_score']:.4f} ({classification['text']}), "
-                      f"Diff %: {analysis['diff_percent']:.2f}%, "
-                      f"Sig. Regions: {analysis['num_significant_diff_regions']}, "
-                      f"Largest Region: {analysis['largest_diff_region_area_percent']:.2f}%")
+            with instrumentation.timed("dom_diff"):
+                dom_changes = _compare_dom_snapshots(data1, data2)
+            if dom_changes:
+                result_entry["dom_counts"] = dom_changes["counts"]
+                result_entry["dom_structure_match"] = dom_changes["structure_match"]
+                print(f"  DOM diff: {dom_changes['counts']}")
+
+            if skip_pixel_on_dom_match and dom_changes and dom_changes["structure_match"]:
+                print(f"  DOM structure and key styles match for '{norm_path}'; skipping pixel analysis.")
+                result_entry["ssim_classification_text"] = "DOM Match"
+                result_entry["ssim_classification_range"] = "(Structure and key styles identical; pixel analysis skipped)"
             else:
-                print(f"  Analysis failed or was skipped for '{norm_path}'.")
+                print(f"  Analyzing differences for '{norm_path}'...")
+                start_time = time.time()
+
+                # Only scores and metadata are produced here; diff images are rendered on demand
+                analysis = analyze_pixel_and_structural_differences(
+                    data1["img_path"],  # Original project-relative path
+                    data2["img_path"],  # Original project-relative path
+                    None,
+                    metric_names,
+                    detail_metric_names,
+                    result_entry["mask_rects1"],
+                    result_entry["mask_rects2"],
+                    use_decoded_cache,
+                )
+                end_time = time.time()
+                instrumentation.observe("pair_analysis", end_time - start_time)
+                print(
+                    f"  Analysis for '{norm_path}' took {end_time - start_time:.2f} seconds."
+                )
+
+                result_entry["score"] = analysis["ssim_score"]
+                result_entry["diff_percent"] = analysis["diff_percent"]
+                result_entry["num_significant_diff_regions"] = analysis["num_significant_diff_regions"]
+                result_entry["largest_diff_region_area_percent"] = analysis["largest_diff_region_area_percent"]
+                for key in ("ms_ssim_score", "phash_distance", "color_delta", "edge_diff_percent", "flagged", "pyramid_decision", "pyramid_estimate_margin"):
+                    result_entry[key] = analysis[key]
+
+                classification = get_ssim_classification(analysis["ssim_score"])
+                if analysis["ssim_score"] is None and analysis["flagged"] is False:
+                    classification = {"text": "Not Flagged", "range_display": "(Passed triage metrics)"}
+                result_entry["ssim_classification_text"] = classification["text"]
+                result_entry["ssim_classification_range"] = classification[
+                    "range_display"
+                ]  # Keep this for now, can be removed from display later if not needed
+
+                if analysis["ssim_score"] is not None:
+                    print(f"  SSIM: {analysis['ssim_score']:.4f} ({classification['text']}), "
+                          f"Diff %: {_format_percent(analysis['diff_percent'])}, "
+                          f"Sig. Regions: {analysis['num_significant_diff_regions']}, "
+                          f"Largest Region: {_format_percent(analysis['largest_diff_region_area_percent'])}"
+                          + (f", Pyramid: {analysis['pyramid_decision']}" if analysis["pyramid_decision"] else "")
+                          + (f" (estimate, +/-{analysis['pyramid_estimate_margin']:.3f})"
+                             if analysis["pyramid_estimate_margin"] is not None else ""))
+                elif analysis["flagged"] is False:
+                    print(f"  Not flagged by triage metrics for '{norm_path}' "
+                          f"(Diff %: {_format_percent(analysis['diff_percent'])}, "
+                          f"pHash distance: {analysis['phash_distance']}).")
+                else:
+                    print(f"  Analysis failed or was skipped for '{norm_path}'.")
+                if dom_changes and analysis["diff_regions"]:
+                    result_entry["dom_explanations"] = dom_diff.explain_diff_regions(
+                        dom_changes, analysis["diff_regions"], analysis["diff_regions2"]
+                    )
+            # The DOM snapshot is taken at the primary viewport only, so other viewports
+            # are always compared pixel by pixel.
+            result_entry["viewports"] = _compare_viewports(
+                data1, data2, metric_names, detail_metric_names, use_decoded_cache
+            )
         # ... (elif data1, elif data2, results.append, sort) ...
         elif data1:
             print(f"  Page only in site 1: {norm_path}")
@@ -387,12 +470,7 @@ def compare_pages(pages1_data, pages2_data, base_url1, base_url2):
             print(f"  Page only in site 2: {norm_path}")
         results.append(result_entry)
 
-    results.sort(
-        key=lambda x: (
-            x["score"] is not None,
-            x["score"] if x["score"] is not None else -1,
-        ),
-        reverse=True,
-    )
+    results.sort(key=_result_sort_key, reverse=True)
+    instrumentation.set_gauge("compare_queue_depth", 0)
     print(f"\nComparison finished. Processed {total_paths} page paths.")
     return results
@@ -0,0 +1,154 @@
+# crawl_manifest.py
+import hashlib
+import json
+import os
+from collections.abc import Mapping
+
+# Streaming crawl manifest: one compact JSON record per page, appended by the
+# crawler as each page is captured, plus a small index of byte offsets so a
+# saved crawl can be opened without parsing every record. ManifestPages exposes
+# the manifest as a read-only pages_data mapping that reads records on demand.
+# Crawls saved before the manifest existed (crawled_data.json) still load.
+
+MANIFEST_FILENAME = "manifest.jsonl"
+MANIFEST_INDEX_FILENAME = "manifest.idx.json"
+LEGACY_CRAWLED_DATA_FILENAME = "crawled_data.json"
+MANIFEST_VERSION = 1
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def manifest_path(directory_path):
+    return os.path.join(directory_path, MANIFEST_FILENAME)
+
+
+def has_crawl_data(directory_path):
+    return os.path.exists(manifest_path(directory_path)) or os.path.exists(
+        os.path.join(directory_path, LEGACY_CRAWLED_DATA_FILENAME)
+    )
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def start_manifest(directory_path):
+    """Creates an empty manifest, discarding any left over from an earlier crawl."""
+    os.makedirs(directory_path, exist_ok=True)
+    open(manifest_path(directory_path), "w").close()
+    index_path = os.path.join(directory_path, MANIFEST_INDEX_FILENAME)
+    if os.path.exists(index_path):
+        os.remove(index_path)
+
+
+def append_page_record(directory_path, normalized_path, page_data):
+    """Appends one page record; a later record for the same path replaces earlier ones."""
+    record = dict(page_data, normalized_path=normalized_path)
+    line = json.dumps(record, separators=(",", ":")) + "\n"
+    with open(manifest_path(directory_path), "a") as f:
+        f.write(line)
+        f.flush()
+
+
+def build_manifest_index(directory_path):
+    """Scans the manifest once and returns {"offsets": {path: byte offset}, ...}."""
+    offsets = {}
+    path = manifest_path(directory_path)
+    with open(path, "rb") as f:
+        offset = 0
+        for line in f:
+            if line.endswith(b"\n"):  # A partial last line means the crawl was interrupted
+                try:
+                    offsets[json.loads(line)["normalized_path"]] = offset
+                except (ValueError, KeyError):
+                    print(f"Warning: Skipping unreadable manifest record at byte {offset} in {path}")
+            offset += len(line)
+    return {"version": MANIFEST_VERSION, "manifest_size": os.path.getsize(path), "offsets": offsets}
+
+
+def write_manifest_index(directory_path):
+    index = build_manifest_index(directory_path)
+    index_path = os.path.join(directory_path, MANIFEST_INDEX_FILENAME)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, separators=(",", ":"))
+    os.replace(tmp_path, index_path)
+    return index
+
+
+def _load_manifest_index(directory_path):
+    index_path = os.path.join(directory_path, MANIFEST_INDEX_FILENAME)
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+        if (
+            index.get("version") == MANIFEST_VERSION
+            and index.get("manifest_size") == os.path.getsize(manifest_path(directory_path))
+        ):
+            return index
+        print(f"Manifest index {index_path} is stale; rebuilding it.")
+    except FileNotFoundError:
+        print(f"Manifest index missing in {directory_path}; rebuilding it.")
+    except Exception as e:
+        print(f"Warning: Could not read manifest index {index_path} ({e}); rebuilding it.")
+    try:
+        return write_manifest_index(directory_path)
+    except OSError:
+        return build_manifest_index(directory_path)  # Read-only crawl folder
+
+
+class ManifestPages(Mapping):
+    """Read-only pages_data mapping backed by a manifest; records are read on access."""
+
+    def __init__(self, directory_path):
+        self.path = manifest_path(directory_path)
+        self._offsets = _load_manifest_index(directory_path)["offsets"]
+
+    def __getitem__(self, normalized_path):
+        offset = self._offsets[normalized_path]
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            record = json.loads(f.readline())
+        record.pop("normalized_path", None)
+        return record
+
+    def __iter__(self):
+        return iter(self._offsets)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __contains__(self, normalized_path):
+        return normalized_path in self._offsets
+
+
+def load_crawl(directory_path):
+    """
+    Returns the pages_data of a saved crawl: a ManifestPages for manifest crawls,
+    or a dict for crawls saved as crawled_data.json. Returns None on failure.
+    """
+    if os.path.exists(manifest_path(directory_path)):
+        try:
+            pages = ManifestPages(directory_path)
+            print(f"Crawl manifest opened from {directory_path} ({len(pages)} pages)")
+            return pages
+        except Exception as e:
+            print(f"ERROR: Could not open crawl manifest in {directory_path}: {e}")
+            return None
+
+    filepath = os.path.join(directory_path, LEGACY_CRAWLED_DATA_FILENAME)
+    try:
+        with open(filepath, "r") as f:
+            data = json.load(f)
+        print(f"Crawled data loaded successfully from {filepath}")
+        return data
+    except FileNotFoundError:
+        print(f"ERROR: No crawl manifest or crawled data file found in {directory_path}. Cannot load.")
+    except json.JSONDecodeError:
+        print(f"ERROR: Crawled data file at {filepath} is corrupted or not valid JSON.")
+    except Exception as e:
+        print(f"ERROR: Could not load crawled data from {filepath}: {e}")
+    return None
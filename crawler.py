@@ -6,12 +6,21 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import (
     Service as ChromeService,
 )  # For newer Selenium
+from selenium.webdriver.firefox.options import Options as FirefoxOptions
+from selenium.webdriver.firefox.service import Service as FirefoxService
 from webdriver_manager.chrome import (
     ChromeDriverManager,
 )  # Optional: for easy driver management
+from webdriver_manager.firefox import GeckoDriverManager
+import re
 import time
 import os
+import json
 from PIL import Image
+import crawl_manifest
+import instrumentation
+import masks
+import path_matcher
 
 ELEMENT_SELECTORS_TO_HIDE_ON_NEW_SITE = [
     ".usa-accordion",  # Selector for the accordion
@@ -55,6 +64,202 @@ TARGET_INITIAL_DESKTOP_HEIGHT = (
     1080  # A common default, also acts as a minimum screenshot height
 )
 
+# Capture matrix: every page is also captured at these (browser, width) viewports.
+# The primary viewport is always captured first; its screenshot is the page's
+# img_path, and the DOM snapshot is taken at its size.
+SUPPORTED_BROWSERS = ("chrome", "firefox")
+PRIMARY_VIEWPORT = ("chrome", TARGET_DESKTOP_WIDTH)
+MIN_VIEWPORT_WIDTH = 320
+MAX_VIEWPORT_WIDTH = 3840
+
+
+def viewport_key(browser, width):
+    return f"{browser}-{width}"
+
+
+def parse_capture_matrix(matrix_text):
+    """
+    Parses viewports given as comma/space separated '[browser:]width' entries,
+    e.g. '375, 768, 1280, firefox:1920' (browser defaults to chrome).
+    Returns a list of (browser, width) starting with PRIMARY_VIEWPORT.
+    """
+    matrix = [PRIMARY_VIEWPORT]
+    for entry in re.split(r"[,\s]+", (matrix_text or "").strip().lower()):
+        if not entry:
+            continue
+        browser, _, width_text = entry.rpartition(":")
+        browser = browser or "chrome"
+        try:
+            width = int(width_text)
+        except ValueError:
+            print(f"Warning: Ignoring capture viewport '{entry}' (expected '[browser:]width').")
+            continue
+        if browser not in SUPPORTED_BROWSERS:
+            print(f"Warning: Ignoring capture viewport '{entry}' (browser must be one of {', '.join(SUPPORTED_BROWSERS)}).")
+            continue
+        if not MIN_VIEWPORT_WIDTH <= width <= MAX_VIEWPORT_WIDTH:
+            print(f"Warning: Ignoring capture viewport '{entry}' (width must be {MIN_VIEWPORT_WIDTH}-{MAX_VIEWPORT_WIDTH}px).")
+            continue
+        if (browser, width) not in matrix:
+            matrix.append((browser, width))
+    return matrix
+
+
+MAX_DOM_SNAPSHOT_ELEMENTS = 5000
+DOM_SNAPSHOT_KEY_STYLES = [
+    "display",
+    "position",
+    "color",
+    "background-color",
+    "font-family",
+    "font-size",
+    "font-weight",
+    "border-top-width",
+    "border-top-color",
+    "margin-top",
+    "padding-top",
+]
+
+# Walks the rendered DOM and returns a compact list of visible elements with their
+# selector path, bounding box (document coordinates), key computed styles and own text.
+JS_DOM_SNAPSHOT = """
+    const keyStyles = arguments[0];
+    const maxElements = arguments[1];
+    const skipTags = new Set(['SCRIPT', 'STYLE', 'NOSCRIPT', 'META', 'LINK', 'TEMPLATE', 'HEAD']);
+    const elements = [];
+    const walk = (el, path) => {
+        if (elements.length >= maxElements || skipTags.has(el.tagName)) return;
+        const cs = window.getComputedStyle(el);
+        if (cs.display === 'none' || cs.visibility === 'hidden') return;
+        const rect = el.getBoundingClientRect();
+        if (rect.width > 0 && rect.height > 0) {
+            const style = {};
+            keyStyles.forEach(function(prop) { style[prop] = cs.getPropertyValue(prop); });
+            let text = '';
+            el.childNodes.forEach(function(node) {
+                if (node.nodeType === Node.TEXT_NODE) text += node.textContent;
+            });
+            elements.push({
+                path: path,
+                tag: el.tagName.toLowerCase(),
+                id: el.id || '',
+                cls: (typeof el.className === 'string') ? el.className.trim() : '',
+                box: [Math.round(rect.left + window.scrollX), Math.round(rect.top + window.scrollY),
+                      Math.round(rect.width), Math.round(rect.height)],
+                style: style,
+                text: text.replace(/\\s+/g, ' ').trim().slice(0, 200)
+            });
+        }
+        const counts = {};
+        Array.from(el.children).forEach(function(child) {
+            const tag = child.tagName.toLowerCase();
+            counts[tag] = (counts[tag] || 0) + 1;
+            walk(child, path + '>' + tag + ':nth-of-type(' + counts[tag] + ')');
+        });
+    };
+    walk(document.body, 'body');
+    return {
+        width: document.documentElement.scrollWidth,
+        height: document.documentElement.scrollHeight,
+        elements: elements
+    };
+"""
+
+
+def capture_dom_snapshot(driver, url, output_path):
+    """
+    Saves a compact DOM snapshot (see JS_DOM_SNAPSHOT) of the currently loaded page
+    as JSON. Returns True on success.
+    """
+    try:
+        snapshot = driver.execute_script(
+            JS_DOM_SNAPSHOT, DOM_SNAPSHOT_KEY_STYLES, MAX_DOM_SNAPSHOT_ELEMENTS
+        )
+        snapshot["url"] = url
+        with open(output_path, "w") as f:
+            json.dump(snapshot, f, separators=(",", ":"))
+        print(
+            f"[{url}] DOM snapshot saved: {output_path} ({len(snapshot['elements'])} elements)"
+        )
+        return True
+    except Exception as e:
+        print(f"[{url}] Error capturing DOM snapshot: {e}")
+        return False
+
+
+JS_RESOLVE_MASK_SELECTORS = """
+    const rects = [];
+    arguments[0].forEach(function(selector) {
+        let els;
+        try { els = document.querySelectorAll(selector); } catch (e) { return; }
+        els.forEach(function(el) {
+            const r = el.getBoundingClientRect();
+            if (r.width > 0 && r.height > 0) {
+                rects.push([Math.round(r.left + window.scrollX), Math.round(r.top + window.scrollY),
+                            Math.round(r.width), Math.round(r.height)]);
+            }
+        });
+    });
+    return rects;
+"""
+
+
+def resolve_mask_selectors(driver, url, selectors):
+    """
+    Returns the bounding boxes ([x, y, w, h], page coordinates) of all elements
+    matching the mask selectors on the currently loaded page.
+    """
+    if not selectors:
+        return []
+    try:
+        rects = driver.execute_script(JS_RESOLVE_MASK_SELECTORS, selectors)
+        print(f"[{url}] Resolved {len(rects)} mask region(s) from {len(selectors)} selector(s).")
+        return rects
+    except Exception as e:
+        print(f"[{url}] Error resolving mask selectors: {e}")
+        return []
+
+
+JS_GET_PAGE_DIMENSIONS = """
+    return {
+        width: Math.max(
+            document.body.scrollWidth, document.documentElement.scrollWidth,
+            document.body.offsetWidth, document.documentElement.offsetWidth,
+            document.body.clientWidth, document.documentElement.clientWidth
+        ),
+        height: Math.max(
+            document.body.scrollHeight, document.documentElement.scrollHeight,
+            document.body.offsetHeight, document.documentElement.offsetHeight,
+            document.body.clientHeight, document.documentElement.clientHeight
+        )
+    };
+"""
+
+
+def capture_viewport(driver, output_path, width=TARGET_DESKTOP_WIDTH):
+    """
+    Saves a full-page screenshot of the already loaded page at the given viewport
+    width: the window is reset to width x TARGET_INITIAL_DESKTOP_HEIGHT, the page
+    height is measured, and the window is grown to fit it before capturing.
+    """
+    # Reset window to a known state before measuring the page's content at this width.
+    with instrumentation.timed("viewport_resize"):
+        driver.set_window_size(width, TARGET_INITIAL_DESKTOP_HEIGHT)
+    with instrumentation.timed("wait"):
+        time.sleep(0.5)
+
+    dimensions = driver.execute_script(JS_GET_PAGE_DIMENSIONS)
+    page_content_height = dimensions["height"]
+    screenshot_height = max(page_content_height, TARGET_INITIAL_DESKTOP_HEIGHT)
+
+    with instrumentation.timed("viewport_resize"):
+        driver.set_window_size(width, screenshot_height)
+    with instrumentation.timed("wait"):
+        time.sleep(1.5)
+
+    with instrumentation.timed("capture"):
+        driver.save_screenshot(output_path)
+
 
 # --- Selenium Screenshot Function ---
 def take_fullpage_screenshot(
@@ -63,13 +268,24 @@ def take_fullpage_screenshot(
     output_path,
     is_modern_site_with_elements_to_hide=False,
     selectors_to_hide=None,
+    dom_snapshot_path=None,
+    width=TARGET_DESKTOP_WIDTH,
 ):  # Changed parameter name for clarity
     """
-    Navigates to a URL, optionally hides specified elements, and takes a full-page screenshot.
+    Navigates to a URL, optionally hides specified elements, and takes a full-page screenshot
+    at the given viewport width. The page stays loaded, so further widths can be captured
+    with capture_viewport without navigating again.
+    If dom_snapshot_path is given, a DOM snapshot is captured at the same window size.
     """
     try:
-        driver.get(url)
-        time.sleep(3)  # Wait for initial page load
+        # Load at the capture width: the window may still be at another viewport's size
+        # from the previous page, and on-load JS / media queries depend on it.
+        with instrumentation.timed("viewport_resize"):
+            driver.set_window_size(width, TARGET_INITIAL_DESKTOP_HEIGHT)
+        with instrumentation.timed("navigation"):
+            driver.get(url)
+        with instrumentation.timed("wait"):
+            time.sleep(3)  # Wait for initial page load
 
         # Conditionally hide elements if this is the modern site and selectors are provided
         if (
@@ -79,6 +295,7 @@ def take_fullpage_screenshot(
         ):
             print(f"[{url}] Attempting to hide specified elements for modern site...")
             any_element_actioned = False
+            hide_start = time.perf_counter()
             for selector in selectors_to_hide:
                 if not selector.strip():  # Skip empty selectors
                     continue
@@ -107,11 +324,13 @@ def take_fullpage_screenshot(
                     print(
                         f"    - Error trying to hide elements for selector '{selector}': {e}"
                     )
+            instrumentation.observe("element_hiding", time.perf_counter() - hide_start)
 
             if any_element_actioned:
-                time.sleep(
-                    0.5
-                )  # Give a brief moment for the page to reflow if anything was hidden
+                with instrumentation.timed("wait"):
+                    time.sleep(
+                        0.5
+                    )  # Give a brief moment for the page to reflow if anything was hidden
                 print(f"[{url}] Element hiding process completed.")
         elif (
             is_modern_site_with_elements_to_hide and selectors_to_hide
@@ -120,36 +339,11 @@ def take_fullpage_screenshot(
                 f"[{url}] Warning: selectors_to_hide was provided but is not a list. Type: {type(selectors_to_hide)}"
             )
 
-        # Reset window to a known state before measuring the new page's content.
-        # print(f"[{url}] Resetting window to: {TARGET_DESKTOP_WIDTH}x{TARGET_INITIAL_DESKTOP_HEIGHT}") # Already verbose
-        driver.set_window_size(TARGET_DESKTOP_WIDTH, TARGET_INITIAL_DESKTOP_HEIGHT)
-        time.sleep(0.5)
-
-        js_get_page_dimensions = """
-            return {
-                width: Math.max(
-                    document.body.scrollWidth, document.documentElement.scrollWidth,
-                    document.body.offsetWidth, document.documentElement.offsetWidth,
-                    document.body.clientWidth, document.documentElement.clientWidth
-                ),
-                height: Math.max(
-                    document.body.scrollHeight, document.documentElement.scrollHeight,
-                    document.body.offsetHeight, document.documentElement.offsetHeight,
-                    document.body.clientHeight, document.documentElement.clientHeight
-                )
-            };
-        """
-        dimensions = driver.execute_script(js_get_page_dimensions)
-        page_content_height = dimensions["height"]
-        screenshot_width = TARGET_DESKTOP_WIDTH
-        screenshot_height = max(page_content_height, TARGET_INITIAL_DESKTOP_HEIGHT)
-
-        # print(f"[{url}] Page content height: {page_content_height}px. Final screenshot size: {screenshot_width}x{screenshot_height}") # Already verbose
-        driver.set_window_size(screenshot_width, screenshot_height)
-        time.sleep(1.5)
-
-        driver.save_screenshot(output_path)
+        capture_viewport(driver, output_path, width)
         print(f"[{url}] Screenshot saved: {output_path}")
+        if dom_snapshot_path:
+            with instrumentation.timed("dom_snapshot"):
+                capture_dom_snapshot(driver, url, dom_snapshot_path)
         page_title = driver.title
         return page_title
 
@@ -162,8 +356,90 @@ def take_fullpage_screenshot(
         return None
 
 
+def _screenshot_metadata(image_path):
+    """Dimensions and content hash of a saved screenshot, for the crawl manifest."""
+    try:
+        with Image.open(image_path) as img:
+            width, height = img.size
+        return {"width": width, "height": height, "content_hash": crawl_manifest.file_sha256(image_path)}
+    except Exception as e:
+        print(f"Could not read screenshot metadata for {image_path}: {e}")
+        return {}
+
+
+def _init_firefox_driver():
+    firefox_options = FirefoxOptions()
+    firefox_options.add_argument("--headless")
+    firefox_options.add_argument(f"--width={TARGET_DESKTOP_WIDTH}")
+    firefox_options.add_argument(f"--height={TARGET_INITIAL_DESKTOP_HEIGHT}")
+    return webdriver.Firefox(
+        service=FirefoxService(GeckoDriverManager().install()),
+        options=firefox_options,
+    )
+
+
+def capture_extra_viewports(
+    drivers, viewports, url, output_dir_base, page_stem, selectors_to_hide=None, mask_selectors=None
+):
+    """
+    Captures the extra (browser, width) viewports of one page. Each browser navigates
+    at most once; the Chrome page is reused from the primary capture. Mask selectors
+    are resolved again at every width, since the layout changes with it.
+    Returns {viewport_key: {"img_path", "width", "height", "content_hash", ...}}.
+    """
+    captured = {}
+    for browser in SUPPORTED_BROWSERS:
+        driver = drivers.get(browser)
+        widths = [width for vp_browser, width in viewports if vp_browser == browser]
+        if driver is None or not widths:
+            continue
+        loaded = browser == PRIMARY_VIEWPORT[0]  # Still on the page after the primary capture
+        for width in widths:
+            key = viewport_key(browser, width)
+            output_path = os.path.join(output_dir_base, f"{page_stem}_{key}.png")
+            capture_start = time.perf_counter()
+            try:
+                with instrumentation.timed("viewport_capture", viewport=key):
+                    if loaded:
+                        capture_viewport(driver, output_path, width)
+                    else:
+                        loaded = (
+                            take_fullpage_screenshot(
+                                driver,
+                                url,
+                                output_path,
+                                is_modern_site_with_elements_to_hide=bool(selectors_to_hide),
+                                selectors_to_hide=selectors_to_hide,
+                                width=width,
+                            )
+                            is not None
+                        )
+                        if not loaded:
+                            break  # Navigation failed; skip this browser's other widths
+            except Exception as e:
+                print(f"[{url}] Error capturing viewport {key}: {e}")
+                continue
+            entry = {
+                "img_path": output_path,
+                "capture_ms": round((time.perf_counter() - capture_start) * 1000.0, 1),
+            }
+            entry.update(_screenshot_metadata(output_path))
+            if mask_selectors:
+                with instrumentation.timed("mask_resolution"):
+                    entry["mask_rects"] = resolve_mask_selectors(driver, url, mask_selectors)
+            captured[key] = entry
+            print(f"[{url}] Viewport {key} saved: {output_path}")
+    return captured
+
+
 # --- Main Crawl Function ---
-def crawl_website(start_url, output_dir_base, is_modern_site=False):
+def crawl_website(start_url, output_dir_base, is_modern_site=False, mask_rules=None, capture_matrix=None):
+    """
+    Crawls the site, saving screenshots and a streaming manifest (see crawl_manifest.py)
+    in output_dir_base. Returns pages_data keyed by normalized path.
+    capture_matrix: (browser, width) viewports to capture in addition to the primary
+                    one (see parse_capture_matrix); stored under each page's 'viewports'
+    """
     domain_name = get_domain(start_url)
     if not domain_name:
         print(f"Invalid start URL: {start_url}")
@@ -191,6 +467,16 @@ def crawl_website(start_url, output_dir_base, is_modern_site=False):
         print(f"Failed to initialize WebDriver: {e}.")
         return {}
 
+    extra_viewports = [vp for vp in (capture_matrix or []) if vp != PRIMARY_VIEWPORT]
+    drivers = {"chrome": driver}
+    if any(browser == "firefox" for browser, _ in extra_viewports):
+        try:
+            drivers["firefox"] = _init_firefox_driver()
+        except Exception as e:
+            print(f"Failed to initialize Firefox WebDriver: {e}. Firefox viewports will be skipped.")
+    hide_selectors = ELEMENT_SELECTORS_TO_HIDE_ON_NEW_SITE if is_modern_site else None
+
+    crawl_manifest.start_manifest(output_dir_base)
     count = 0
     while to_visit:
         current_url = to_visit.pop()
@@ -207,25 +493,31 @@ def crawl_website(start_url, output_dir_base, is_modern_site=False):
         visited.add(current_url)
         print(f"Visiting: {current_url} (Is Modern Site: {is_modern_site})")
 
+        normalized_path = None  # Set once the page is captured; its record is appended in finally
         try:
             relative_url_path = parsed_current_url.path.strip("/")
             if not relative_url_path:
                 filename_base = "index"
             else:
                 filename_base = relative_url_path.replace("/", "_").replace(".", "_")
-            screenshot_filename = f"page_{count}_{filename_base}.png"
+            page_stem = f"page_{count}_{filename_base}"
+            screenshot_filename = f"{page_stem}.png"
             full_screenshot_path = os.path.join(output_dir_base, screenshot_filename)
+            dom_snapshot_path = os.path.join(
+                output_dir_base, f"dom_page_{count}_{filename_base}.json"
+            )
 
+            capture_start = time.perf_counter()
             page_title = take_fullpage_screenshot(
                 driver,
                 current_url,
                 full_screenshot_path,
                 is_modern_site_with_elements_to_hide=is_modern_site,  # Pass the flag
                 # Pass the list of selectors if it's the modern site, otherwise None
-                selectors_to_hide=ELEMENT_SELECTORS_TO_HIDE_ON_NEW_SITE
-                if is_modern_site
-                else None,
+                selectors_to_hide=hide_selectors,
+                dom_snapshot_path=dom_snapshot_path,
             )
+            capture_ms = (time.perf_counter() - capture_start) * 1000.0
             count += 1
 
             if page_title is not None:
@@ -234,9 +526,41 @@ def crawl_website(start_url, output_dir_base, is_modern_site=False):
                     "img_path": full_screenshot_path,
                     "title": page_title,
                     "full_url": current_url,
+                    "viewport": viewport_key(*PRIMARY_VIEWPORT),
+                    "capture_timings_ms": {"screenshot": round(capture_ms, 1)},
                 }
+                pages_data[normalized_path].update(_screenshot_metadata(full_screenshot_path))
+                if os.path.exists(dom_snapshot_path):
+                    pages_data[normalized_path]["dom_path"] = dom_snapshot_path
+                # Driver is still on the page at screenshot size, so boxes match the image
+                mask_selectors = masks.selectors_for_page(
+                    mask_rules or [],
+                    "modern" if is_modern_site else "legacy",
+                    domain_name,
+                    normalized_path,
+                )
+                if mask_selectors:
+                    with instrumentation.timed("mask_resolution"):
+                        pages_data[normalized_path]["mask_rects"] = resolve_mask_selectors(
+                            driver, current_url, mask_selectors
+                        )
+                if extra_viewports:
+                    viewports_start = time.perf_counter()
+                    pages_data[normalized_path]["viewports"] = capture_extra_viewports(
+                        drivers,
+                        extra_viewports,
+                        current_url,
+                        output_dir_base,
+                        page_stem,
+                        selectors_to_hide=hide_selectors,
+                        mask_selectors=mask_selectors,
+                    )
+                    pages_data[normalized_path]["capture_timings_ms"]["viewports"] = round(
+                        (time.perf_counter() - viewports_start) * 1000.0, 1
+                    )
 
             # ... (rest of your link finding logic) ...
+            link_extraction_start = time.perf_counter()
             try:
                 page_content_response = requests.get(current_url, timeout=10)
                 page_content_response.raise_for_status()
@@ -272,8 +596,37 @@ def crawl_website(start_url, output_dir_base, is_modern_site=False):
                     and clean_url_for_visit not in visited
                 ):
                     to_visit.add(clean_url_for_visit)
+            link_extraction_sec = time.perf_counter() - link_extraction_start
+            instrumentation.observe("link_extraction", link_extraction_sec)
+
+            # Content signature for fuzzy path matching between restructured sites
+            if page_title is not None:
+                pages_data[normalized_path]["capture_timings_ms"]["link_extraction"] = round(
+                    link_extraction_sec * 1000.0, 1
+                )
+                with instrumentation.timed("content_signature"):
+                    pages_data[normalized_path]["minhash"] = (
+                        path_matcher.build_content_signature(soup)
+                    )
         except Exception as e:
             print(f"Error processing {current_url}: {e}")
-
-    driver.quit()
+        finally:
+            if normalized_path is not None:
+                try:
+                    crawl_manifest.append_page_record(
+                        output_dir_base, normalized_path, pages_data[normalized_path]
+                    )
+                except Exception as e:
+                    print(f"Error writing manifest record for {current_url}: {e}")
+            site_role = "modern" if is_modern_site else "legacy"
+            instrumentation.set_gauge("crawl_queue_depth", len(to_visit), site=site_role)
+            instrumentation.set_gauge("crawl_pages_visited", len(visited), site=site_role)
+            instrumentation.sample_memory()
+
+    for active_driver in drivers.values():
+        active_driver.quit()
+    try:
+        crawl_manifest.write_manifest_index(output_dir_base)
+    except Exception as e:
+        print(f"Error writing manifest index for {output_dir_base}: {e}")
     return pages_data
@@ -0,0 +1,145 @@
+# dom_diff.py
+import json
+from collections import defaultdict
+
+# Structural comparison of two DOM snapshots captured by crawler.capture_dom_snapshot.
+# Elements are paired by id, then by tag + text, then by selector path, which keeps
+# the diff linear in the number of elements and tolerant of restructured markup.
+
+DOM_MOVE_TOLERANCE_PX = 4  # Ignore sub-pixel/rounding jitter in bounding boxes
+MAX_REPORTED_CHANGES = 50  # Per change type, to keep results small
+MAX_EXPLANATIONS_PER_REGION = 3
+
+
+def load_dom_snapshot(snapshot_path):
+    try:
+        with open(snapshot_path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"Error loading DOM snapshot: File not found at '{snapshot_path}'")
+    except Exception as e:
+        print(f"Error loading DOM snapshot from '{snapshot_path}': {e}")
+    return None
+
+
+def _element_keys(elements):
+    """Returns {key: element}; duplicate keys are disambiguated by occurrence order."""
+    keyed = {}
+    seen = defaultdict(int)
+    for el in elements:
+        if el.get("id"):
+            base = f"id:{el['id']}"
+        elif el.get("text"):
+            base = f"text:{el['tag']}:{el['text']}"
+        else:
+            base = f"path:{el['path']}"
+        seen[base] += 1
+        key = base if seen[base] == 1 else f"{base}#{seen[base]}"
+        keyed[key] = el
+    return keyed
+
+
+def _describe(el):
+    desc = el["tag"]
+    if el.get("id"):
+        desc += f"#{el['id']}"
+    elif el.get("cls"):
+        desc += "." + ".".join(el["cls"].split()[:2])
+    if el.get("text"):
+        desc += f" \"{el['text'][:40]}\""
+    return desc
+
+
+def _change(kind, el1=None, el2=None, **extra):
+    el = el1 or el2
+    change = {
+        "type": kind,
+        "element": _describe(el),
+        "path": el["path"],
+        "box1": el1["box"] if el1 else None,
+        "box2": el2["box"] if el2 else None,
+    }
+    change.update(extra)
+    return change
+
+
+def diff_dom_snapshots(snapshot1, snapshot2):
+    """
+    Compares two DOM snapshots. Returns a dict with lists of 'missing' (only in
+    snapshot1), 'added' (only in snapshot2), 'moved', 'restyled' and 'text_changed'
+    elements, per-type 'counts', and 'structure_match' (True if nothing changed).
+    """
+    keyed1 = _element_keys(snapshot1.get("elements", []))
+    keyed2 = _element_keys(snapshot2.get("elements", []))
+
+    changes = {"missing": [], "added": [], "moved": [], "restyled": [], "text_changed": []}
+    for key, el1 in keyed1.items():
+        el2 = keyed2.get(key)
+        if el2 is None:
+            changes["missing"].append(_change("missing", el1=el1))
+            continue
+        if any(abs(a - b) > DOM_MOVE_TOLERANCE_PX for a, b in zip(el1["box"], el2["box"])):
+            changes["moved"].append(_change("moved", el1, el2))
+        style1, style2 = el1.get("style", {}), el2.get("style", {})
+        changed_props = sorted(p for p in set(style1) | set(style2) if style1.get(p) != style2.get(p))
+        if changed_props:
+            changes["restyled"].append(
+                _change(
+                    "restyled",
+                    el1,
+                    el2,
+                    properties={p: [style1.get(p), style2.get(p)] for p in changed_props},
+                )
+            )
+        if not key.startswith("text:") and el1.get("text") != el2.get("text"):
+            changes["text_changed"].append(
+                _change("text_changed", el1, el2, text=[el1.get("text"), el2.get("text")])
+            )
+    for key, el2 in keyed2.items():
+        if key not in keyed1:
+            changes["added"].append(_change("added", el2=el2))
+
+    counts = {kind: len(items) for kind, items in changes.items()}
+    result = {kind: items[:MAX_REPORTED_CHANGES] for kind, items in changes.items()}
+    result["counts"] = counts
+    result["structure_match"] = not any(counts.values())
+    return result
+
+
+def _boxes_intersect(box1, box2):
+    x1, y1, w1, h1 = box1
+    x2, y2, w2, h2 = box2
+    return x1 < x2 + w2 and x2 < x1 + w1 and y1 < y2 + h2 and y2 < y1 + h1
+
+
+def explain_diff_regions(dom_changes, diff_regions, diff_regions2=None):
+    """
+    Attributes pixel diff regions to changed DOM elements whose boxes overlap them.
+    diff_regions are [x, y, w, h] in page 1 coordinates (matched against box1);
+    diff_regions2 are the same regions in page 2 coordinates (matched against box2),
+    defaulting to diff_regions when both pages share coordinates. Smallest
+    overlapping elements are listed first, as they are the most specific explanation.
+    Returns a list of {"region": [...], "elements": [descriptions]}.
+    """
+    if not dom_changes or not diff_regions:
+        return []
+    diff_regions2 = diff_regions2 or diff_regions
+    candidates = []
+    for kind in ("missing", "added", "moved", "restyled", "text_changed"):
+        for change in dom_changes.get(kind, []):
+            for page, box in ((0, change["box1"]), (1, change["box2"])):
+                if box:
+                    candidates.append((box[2] * box[3], page, box, f"{change['element']} ({kind})"))
+    candidates.sort(key=lambda c: c[0])
+
+    explanations = []
+    for region, region2 in zip(diff_regions, diff_regions2):
+        elements = []
+        for _, page, box, description in candidates:
+            if description not in elements and _boxes_intersect((region, region2)[page], box):
+                elements.append(description)
+                if len(elements) >= MAX_EXPLANATIONS_PER_REGION:
+                    break
+        if elements:
+            explanations.append({"region": region, "elements": elements})
+    return explanations
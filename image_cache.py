@@ -0,0 +1,53 @@
+# image_cache.py
+import os
+import numpy as np
+from PIL import Image
+import instrumentation
+
+# Optional cache of decoded screenshots (grayscale, or RGB when color metrics need
+# it), stored as raw .npy files in a _decoded folder next to each crawl's screenshots. Cached arrays are opened
+# memory-mapped and read-only, so repeat comparisons skip PNG decoding entirely
+# and concurrent processes share the same pages of the OS page cache.
+
+DECODED_CACHE_DIR_NAME = "_decoded"
+
+
+DECODED_MODE_SUFFIXES = {"L": "gray", "RGB": "rgb"}
+
+
+def decoded_cache_path(image_path, mode="L"):
+    directory, filename = os.path.split(image_path)
+    return os.path.join(directory, DECODED_CACHE_DIR_NAME, f"{filename}.{DECODED_MODE_SUFFIXES[mode]}.npy")
+
+
+def _is_fresh(cache_path, image_path):
+    try:
+        return os.path.getmtime(cache_path) >= os.path.getmtime(image_path)
+    except OSError:
+        return False
+
+
+def load_decoded(image_path, mode="L"):
+    """
+    Returns the image converted to mode ('L' or 'RGB') as a uint8 array, memory-mapped
+    from the decoded cache when a fresh entry exists; otherwise decodes the PNG and stores it.
+    """
+    cache_path = decoded_cache_path(image_path, mode)
+    if _is_fresh(cache_path, image_path):
+        try:
+            with instrumentation.timed("decoded_cache", result="hit"):
+                return np.load(cache_path, mmap_mode="r")
+        except Exception as e:
+            print(f"  Warning: Ignoring unreadable decoded cache entry {cache_path}: {e}")
+
+    with instrumentation.timed("decode"):
+        decoded = np.asarray(Image.open(image_path).convert(mode))
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp.npy"
+        with instrumentation.timed("decoded_cache", result="store"):
+            np.save(tmp_path, decoded)
+            os.replace(tmp_path, cache_path)  # Atomic, so readers never see partial files
+    except Exception as e:
+        print(f"  Warning: Could not write decoded cache entry {cache_path}: {e}")
+    return decoded
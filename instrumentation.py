@@ -0,0 +1,155 @@
+# instrumentation.py
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Process-wide stage timings, gauges and an optional per-run trace file.
+# Stage durations are aggregated into Prometheus-style histograms (served by
+# app.py at /metrics) and, while a trace is active, each event is also appended
+# to the trace as one JSON line.
+
+METRIC_PREFIX = "website_comparison"
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_histograms = {}  # (stage, labels) -> {"buckets": [...], "sum": float, "count": int}
+_gauges = {}  # (name, labels) -> value
+_trace_file = None
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _write_trace_event(event):
+    # Caller holds _lock
+    if _trace_file is not None:
+        try:
+            _trace_file.write(json.dumps(event, separators=(",", ":")) + "\n")
+        except Exception as e:
+            print(f"Warning: Could not write trace event: {e}")
+
+
+def start_trace(trace_path):
+    """Starts writing events to trace_path (JSON Lines), closing any previous trace."""
+    global _trace_file
+    stop_trace()
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(trace_path)), exist_ok=True)
+        with _lock:
+            _trace_file = open(trace_path, "a", buffering=1)  # Line-buffered
+        print(f"Writing run trace to {trace_path}")
+    except Exception as e:
+        print(f"ERROR: Could not open trace file {trace_path}: {e}")
+
+
+def stop_trace():
+    global _trace_file
+    with _lock:
+        if _trace_file is not None:
+            _trace_file.close()
+            _trace_file = None
+
+
+def observe(stage, seconds, **labels):
+    key = (stage, _label_key(labels))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = {"buckets": [0] * len(DURATION_BUCKETS), "sum": 0.0, "count": 0}
+            _histograms[key] = hist
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                hist["buckets"][i] += 1
+        hist["sum"] += seconds
+        hist["count"] += 1
+        event = {"ts": time.time(), "stage": stage, "duration_ms": round(seconds * 1000.0, 3)}
+        event.update(dict(key[1]))
+        _write_trace_event(event)
+
+
+@contextlib.contextmanager
+def timed(stage, **labels):
+    """Context manager recording the duration of the enclosed block under 'stage'."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start, **labels)
+
+
+def set_gauge(name, value, **labels):
+    key = (name, _label_key(labels))
+    with _lock:
+        _gauges[key] = value
+        event = {"ts": time.time(), "gauge": name, "value": value}
+        event.update(dict(key[1]))
+        _write_trace_event(event)
+
+
+def current_rss_bytes():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        pass
+    if resource is not None:
+        # Peak rather than current RSS, but the best available without /proc
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    return None
+
+
+def sample_memory(**labels):
+    rss = current_rss_bytes()
+    if rss is not None:
+        set_gauge("memory_rss_bytes", rss, **labels)
+    return rss
+
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(label_items, extra=None):
+    items = list(label_items) + list(extra or [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label_value(v)}"' for k, v in items) + "}"
+
+
+def render_prometheus():
+    """Returns all metrics in the Prometheus text exposition format."""
+    with _lock:
+        histograms = {k: {"buckets": list(v["buckets"]), "sum": v["sum"], "count": v["count"]} for k, v in _histograms.items()}
+        gauges = dict(_gauges)
+
+    lines = []
+    if histograms:
+        name = f"{METRIC_PREFIX}_stage_duration_seconds"
+        lines.append(f"# HELP {name} Time spent per crawl/compare stage.")
+        lines.append(f"# TYPE {name} histogram")
+        for (stage, label_items), hist in sorted(histograms.items()):
+            base = [("stage", stage)] + list(label_items)
+            for bound, count in zip(DURATION_BUCKETS, hist["buckets"]):
+                lines.append(f"{name}_bucket{_format_labels(base, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(base, [('le', '+Inf')])} {hist['count']}")
+            lines.append(f"{name}_sum{_format_labels(base)} {hist['sum']}")
+            lines.append(f"{name}_count{_format_labels(base)} {hist['count']}")
+
+    gauge_names = sorted({name for name, _ in gauges})
+    for gauge_name in gauge_names:
+        name = f"{METRIC_PREFIX}_{gauge_name}"
+        lines.append(f"# TYPE {name} gauge")
+        for (g_name, label_items), value in sorted(gauges.items()):
+            if g_name == gauge_name:
+                lines.append(f"{name}{_format_labels(label_items)} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,71 @@
+# masks.py
+import re
+
+# Masks exclude noisy regions (carousels, dates, ads) from comparison. Each rule
+# applies to one site and optionally one path, and targets either a CSS selector
+# (resolved to bounding boxes by the crawler at capture time) or a fixed pixel
+# rectangle in page coordinates. Rules are given one per line as:
+#     site | path-regex | target
+# where site is '*', 'legacy', 'modern' or a domain, path-regex is '*' or a regex
+# searched in the normalized page path, and target is 'rect:x,y,w,h' or a selector.
+
+SITE_ROLES = ("legacy", "modern")
+
+
+def parse_mask_rules(rules_text):
+    rules = []
+    if not rules_text:
+        return rules
+    for line_no, line in enumerate(rules_text.splitlines(), start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        parts = [part.strip() for part in line.split("|", 2)]
+        if len(parts) != 3 or not all(parts):
+            print(f"Warning: Ignoring mask rule on line {line_no} (expected 'site | path | target'): {line}")
+            continue
+        site, path_pattern, target = parts
+        rule = {"site": site.lower(), "path": None, "selector": None, "rect": None}
+        if path_pattern != "*":
+            try:
+                rule["path"] = re.compile(path_pattern)
+            except re.error as e:
+                print(f"Warning: Ignoring mask rule on line {line_no}, invalid path regex '{path_pattern}': {e}")
+                continue
+        if target.lower().startswith("rect:"):
+            try:
+                rect = [int(v) for v in target[5:].split(",")]
+            except ValueError:
+                rect = []
+            if len(rect) != 4 or rect[2] <= 0 or rect[3] <= 0:
+                print(f"Warning: Ignoring mask rule on line {line_no}, invalid rect '{target}'")
+                continue
+            rule["rect"] = rect
+        else:
+            rule["selector"] = target
+        rules.append(rule)
+    return rules
+
+
+def _rule_applies(rule, site_role, domain, normalized_path):
+    if rule["site"] not in ("*", site_role) and rule["site"] != (domain or "").lower():
+        return False
+    if rule["path"] is not None and not rule["path"].search(normalized_path or ""):
+        return False
+    return True
+
+
+def selectors_for_page(rules, site_role, domain, normalized_path):
+    return [
+        rule["selector"]
+        for rule in rules
+        if rule["selector"] and _rule_applies(rule, site_role, domain, normalized_path)
+    ]
+
+
+def rects_for_page(rules, site_role, domain, normalized_path):
+    return [
+        rule["rect"]
+        for rule in rules
+        if rule["rect"] and _rule_applies(rule, site_role, domain, normalized_path)
+    ]
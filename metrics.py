@@ -0,0 +1,522 @@
+# metrics.py
+from skimage.metrics import structural_similarity as ssim
+import cv2
+from PIL import Image
+import numpy as np
+import image_cache
+import instrumentation
+
+# Pluggable image-difference metrics. Every metric reads from one shared context
+# (the normalized grayscale/RGB array pair plus lazily computed intermediates such
+# as the absdiff and threshold images), so selecting several metrics never
+# decodes, resizes or diffs the same images twice.
+
+MAX_COMPARISON_DIMENSION = 1920  # For resizing images before comparison
+
+MIN_CONTOUR_AREA = 100
+MAX_REPORTED_DIFF_REGIONS = 20  # Largest significant contours reported as page-coordinate boxes
+PIXEL_DIFF_THRESHOLD = 30
+
+MS_SSIM_WEIGHTS = (0.0448, 0.2856, 0.3001, 0.2363, 0.1333)  # Wang et al. 2003
+MS_SSIM_MIN_SIDE = 7  # skimage's default SSIM window needs at least 7x7
+MS_SSIM_WINDOW = (11, 11)
+MS_SSIM_SIGMA = 1.5
+MS_SSIM_C1 = (0.01 * 255) ** 2
+MS_SSIM_C2 = (0.03 * 255) ** 2
+
+PHASH_SIZE = 32  # Image is reduced to 32x32 before the DCT
+PHASH_LOW_FREQ = 8  # Top-left 8x8 DCT coefficients -> 64-bit hash
+
+# Tile-level fast SSIM ("pyramid_ssim") settings. Every decision is taken from the
+# full-resolution absdiff, which costs far less than SSIM: identical pages score 1.0
+# outright, and the page is split into PYRAMID_TILE_SIZE tiles of which only those with
+# any changed pixel get real SSIM (unchanged tiles score exactly 1.0). Such pairs stay
+# within PYRAMID_SSIM_TOLERANCE of full-resolution SSIM (only tile borders differ). When
+# more than PYRAMID_SAMPLE_ABOVE_TILES tiles changed (noise, shifts, redesigns) the changed
+# tiles' score is estimated from random tiles, added until the confidence margin of the
+# page score is within PYRAMID_SAMPLED_SSIM_TOLERANCE (all are refined if it never is).
+# benchmarks/run_benchmarks.py --check-pyramid verifies both tolerances.
+PYRAMID_TILE_SIZE = 256  # Full-resolution tile edge length
+PYRAMID_SAMPLE_ABOVE_TILES = 64
+PYRAMID_MIN_SAMPLE_TILES = 32
+PYRAMID_SAMPLE_BATCH_TILES = 8
+PYRAMID_SAMPLE_CONFIDENCE_Z = 3.0  # Margin = z * standard error (~99.7% for z=3)
+PYRAMID_SSIM_TOLERANCE = 0.01
+PYRAMID_SAMPLED_SSIM_TOLERANCE = 0.03
+
+CANNY_LOW_THRESHOLD = 50
+CANNY_HIGH_THRESHOLD = 150
+
+# Triage thresholds: a page is "flagged" (and gets the detail metrics) if any
+# available cheap metric exceeds its threshold.
+TRIAGE_PHASH_FLAG_DISTANCE = 2
+TRIAGE_DIFF_PERCENT_FLAG = 0.5
+TRIAGE_COLOR_DELTA_FLAG = 2.0
+TRIAGE_SSIM_FLAG = 0.99
+
+
+def load_normalized_pair(image_path1, image_path2, need_color=False, use_decoded_cache=False):
+    """
+    Opens both images and resizes them to a common width (capped at
+    MAX_COMPARISON_DIMENSION) and the shorter common height.
+    Returns a context dict with 'gray1'/'gray2' uint8 arrays and, if need_color,
+    'rgb1'/'rgb2' uint8 arrays. Returns None if the shapes cannot be matched.
+    use_decoded_cache: Read pixels from image_cache (memory-mapped .npy, grayscale or
+                       RGB as needed) instead of decoding the PNGs.
+    """
+    mode = "RGB" if need_color else "L"
+    if use_decoded_cache:
+        cached1 = image_cache.load_decoded(image_path1, mode)
+        cached2 = image_cache.load_decoded(image_path2, mode)
+        (h1, w1), (h2, w2) = cached1.shape[:2], cached2.shape[:2]
+        if w1 == w2 and h1 == h2 and w1 <= MAX_COMPARISON_DIMENSION:
+            # Nothing to resize: use the memory-mapped arrays as they are (zero-copy)
+            scales = {"scale": 1.0, "scale2": 1.0, "scale_y": 1.0, "scale2_y": 1.0}
+            return _pair_context(cached1, cached2, need_color, scales)
+        pil_img1 = Image.fromarray(np.asarray(cached1))
+        pil_img2 = Image.fromarray(np.asarray(cached2))
+    else:
+        # Timed per image, like image_cache's decode on a cache miss
+        with instrumentation.timed("decode"):
+            pil_img1 = Image.open(image_path1).convert(mode)
+        with instrumentation.timed("decode"):
+            pil_img2 = Image.open(image_path2).convert(mode)
+
+    w1, h1 = pil_img1.size
+    w2, h2 = pil_img2.size
+
+    if (
+        w1 != w2
+        or h1 != h2
+        or w1 > MAX_COMPARISON_DIMENSION
+        or h1 > MAX_COMPARISON_DIMENSION
+        or w2 > MAX_COMPARISON_DIMENSION
+        or h2 > MAX_COMPARISON_DIMENSION
+    ):
+        with instrumentation.timed("resize"):
+            target_w = min(w1, w2, MAX_COMPARISON_DIMENSION)
+            r1 = target_w / float(w1) if w1 > 0 else 0
+            th1 = int(h1 * r1)
+            r2 = target_w / float(w2) if w2 > 0 else 0
+            th2 = int(h2 * r2)
+
+            if w1 != target_w or h1 != th1:
+                pil_img1 = pil_img1.resize((max(1, target_w), max(1, th1)), Image.LANCZOS)
+            if w2 != target_w or h2 != th2:
+                pil_img2 = pil_img2.resize((max(1, target_w), max(1, th2)), Image.LANCZOS)
+
+            final_h = min(pil_img1.height, pil_img2.height)
+            final_w = pil_img1.width  # Widths should be same now
+            if pil_img1.height != final_h:
+                pil_img1 = pil_img1.resize((final_w, final_h), Image.LANCZOS)
+            if pil_img2.height != final_h:
+                pil_img2 = pil_img2.resize((final_w, final_h), Image.LANCZOS)
+
+    arr1 = np.asarray(pil_img1)
+    arr2 = np.asarray(pil_img2)
+    if arr1.shape != arr2.shape:
+        print(
+            f"  ERROR: Shape mismatch for diff analysis after resize: {arr1.shape} vs {arr2.shape}"
+        )
+        return None
+
+    # Factors from comparison pixels back to each image's (page) pixels. Pages of
+    # different heights are squashed to the shorter one, so y has its own factor.
+    scales = {
+        "scale": w1 / float(arr1.shape[1]) if arr1.shape[1] > 0 else 1.0,
+        "scale2": w2 / float(arr2.shape[1]) if arr2.shape[1] > 0 else 1.0,
+        "scale_y": h1 / float(arr1.shape[0]) if arr1.shape[0] > 0 else 1.0,
+        "scale2_y": h2 / float(arr2.shape[0]) if arr2.shape[0] > 0 else 1.0,
+    }
+    return _pair_context(arr1, arr2, need_color, scales)
+
+
+def _pair_context(arr1, arr2, need_color, scales):
+    if need_color:
+        return {
+            "rgb1": arr1,
+            "rgb2": arr2,
+            "gray1": cv2.cvtColor(arr1, cv2.COLOR_RGB2GRAY),
+            "gray2": cv2.cvtColor(arr2, cv2.COLOR_RGB2GRAY),
+            **scales,
+        }
+    return {"gray1": arr1, "gray2": arr2, **scales}
+
+
+def _page_scales(ctx, image=1):
+    """(x, y) factors from comparison pixels to page pixels of image 1 or 2."""
+    if image == 2:
+        return ctx.get("scale2", 1.0), ctx.get("scale2_y", ctx.get("scale2", 1.0))
+    return ctx.get("scale", 1.0), ctx.get("scale_y", ctx.get("scale", 1.0))
+
+
+def apply_masks(ctx, mask_rects1=None, mask_rects2=None):
+    """
+    Excludes masked regions ([x, y, w, h] page rects of image 1 / image 2) from all
+    metrics. Rows masked across the full width are dropped from the arrays, so no
+    metric spends any work on them; partially masked pixels are made identical in
+    both images and left out of pixel counts and SSIM averaging.
+    Sets ctx['fully_masked'] if nothing is left to compare.
+    """
+    scaled_rects = [(r,) + _page_scales(ctx, 1) for r in mask_rects1 or []]
+    scaled_rects += [(r,) + _page_scales(ctx, 2) for r in mask_rects2 or []]
+    if not scaled_rects:
+        return ctx
+
+    h, w = ctx["gray1"].shape[:2]
+    mask = np.zeros((h, w), dtype=bool)
+    for (x, y, rect_w, rect_h), scale_x, scale_y in scaled_rects:
+        x0, y0 = max(0, int(x / scale_x)), max(0, int(y / scale_y))
+        x1 = min(w, int(np.ceil((x + rect_w) / scale_x)))
+        y1 = min(h, int(np.ceil((y + rect_h) / scale_y)))
+        if x1 > x0 and y1 > y0:
+            mask[y0:y1, x0:x1] = True
+    if not mask.any():
+        return ctx
+
+    keep_rows = ~mask.all(axis=1)
+    if not keep_rows.any():
+        ctx["fully_masked"] = True
+        return ctx
+    for key in ("gray1", "gray2", "rgb1", "rgb2"):
+        if key in ctx:
+            ctx[key] = ctx[key][keep_rows]  # Boolean indexing copies, so arrays become writable
+    mask = mask[keep_rows]
+    ctx["row_index"] = np.flatnonzero(keep_rows)  # Comparison row -> original row
+
+    if mask.any():
+        ctx["gray2"][mask] = ctx["gray1"][mask]
+        if "rgb1" in ctx:
+            ctx["rgb2"][mask] = ctx["rgb1"][mask]
+        ctx["mask"] = mask
+    return ctx
+
+
+# --- Shared intermediates (computed once per context, on first use) ---
+def _abs_diff(ctx):
+    if "abs_diff" not in ctx:
+        ctx["abs_diff"] = cv2.absdiff(ctx["gray1"], ctx["gray2"])
+    return ctx["abs_diff"]
+
+
+def _threshold_img(ctx):
+    if "threshold_img" not in ctx:
+        _, ctx["threshold_img"] = cv2.threshold(
+            _abs_diff(ctx), PIXEL_DIFF_THRESHOLD, 255, cv2.THRESH_BINARY
+        )
+    return ctx["threshold_img"]
+
+
+def _edges(ctx):
+    if "edges1" not in ctx:
+        ctx["edges1"] = cv2.Canny(ctx["gray1"], CANNY_LOW_THRESHOLD, CANNY_HIGH_THRESHOLD)
+        ctx["edges2"] = cv2.Canny(ctx["gray2"], CANNY_LOW_THRESHOLD, CANNY_HIGH_THRESHOLD)
+    return ctx["edges1"], ctx["edges2"]
+
+
+def _total_pixels(ctx):
+    if "mask" in ctx:
+        if "unmasked_pixels" not in ctx:
+            ctx["unmasked_pixels"] = int(np.count_nonzero(~ctx["mask"]))
+        return ctx["unmasked_pixels"]
+    h, w = ctx["gray1"].shape[:2]
+    return h * w
+
+
+def _to_page_box(ctx, box, image=1):
+    """Maps an [x, y, w, h] box in comparison pixels to image 1 (or 2) page coordinates."""
+    x, y, w, h = box
+    if "row_index" in ctx:
+        row_index = ctx["row_index"]
+        top = int(row_index[y])
+        bottom = int(row_index[min(y + h, len(row_index)) - 1]) + 1
+        y, h = top, bottom - top
+    scale_x, scale_y = _page_scales(ctx, image)
+    return [int(round(x * scale_x)), int(round(y * scale_y)), int(round(w * scale_x)), int(round(h * scale_y))]
+
+
+# --- Metrics ---
+def metric_ssim(ctx):
+    score, ssim_diff_map = ssim(ctx["gray1"], ctx["gray2"], full=True)
+    if "mask" in ctx:
+        score = ssim_diff_map[~ctx["mask"]].mean()
+    ctx["ssim_score"] = float(score)
+    ctx["ssim_diff_map"] = ssim_diff_map  # Kept for heatmaps / region analysis
+    return {"ssim_score": float(score)}
+
+
+def _ssim_terms(img1, img2, mask=None):
+    """
+    Mean luminance and contrast-structure terms of SSIM (Gaussian 11x11 window,
+    sigma 1.5, as in Wang et al.), averaged over unmasked pixels.
+    """
+    a, b = img1.astype(np.float32), img2.astype(np.float32)
+
+    def blur(m):
+        return cv2.GaussianBlur(m, MS_SSIM_WINDOW, MS_SSIM_SIGMA)
+
+    mu1, mu2 = blur(a), blur(b)
+    var1 = blur(a * a) - mu1 * mu1
+    var2 = blur(b * b) - mu2 * mu2
+    covar = blur(a * b) - mu1 * mu2
+    luminance = (2 * mu1 * mu2 + MS_SSIM_C1) / (mu1 * mu1 + mu2 * mu2 + MS_SSIM_C1)
+    contrast_structure = (2 * covar + MS_SSIM_C2) / (var1 + var2 + MS_SSIM_C2)
+    if mask is not None:
+        luminance, contrast_structure = luminance[~mask], contrast_structure[~mask]
+    return float(luminance.mean()), float(contrast_structure.mean())
+
+
+def metric_ms_ssim(ctx):
+    """
+    Multi-scale SSIM (Wang et al. 2003): contrast-structure terms at every 2x pyramid
+    level and the luminance term at the coarsest only, combined as a weighted product.
+    """
+    img1, img2 = ctx["gray1"], ctx["gray2"]
+    mask = ctx.get("mask")
+    cs_terms = []
+    luminance = None
+    for level, _ in enumerate(MS_SSIM_WEIGHTS):
+        if min(img1.shape[:2]) < MS_SSIM_MIN_SIDE:
+            break
+        level_mask = None
+        if mask is not None:
+            level_mask = cv2.resize(
+                mask.astype(np.uint8), (img1.shape[1], img1.shape[0]), interpolation=cv2.INTER_NEAREST
+            ).astype(bool)
+            if level_mask.all():
+                break
+        luminance, cs = _ssim_terms(img1, img2, level_mask)
+        cs_terms.append(max(cs, 0.0))
+        img1, img2 = cv2.pyrDown(img1), cv2.pyrDown(img2)
+    if not cs_terms:
+        return {"ms_ssim_score": None}
+    weights = np.array(MS_SSIM_WEIGHTS[: len(cs_terms)])
+    weights = weights / weights.sum()
+    # The coarsest level contributes luminance as well as contrast-structure
+    terms = np.array(cs_terms)
+    terms[-1] *= max(luminance, 0.0)
+    return {"ms_ssim_score": float(np.prod(np.power(terms, weights)))}
+
+
+def metric_pyramid_ssim(ctx):
+    """
+    Fast SSIM that only computes SSIM where pixels changed (see PYRAMID_* settings).
+    Reports 'ssim_score' so it can stand in for 'ssim', plus how the score was obtained.
+    """
+    gray1, gray2 = ctx["gray1"], ctx["gray2"]
+    diff = _abs_diff(ctx)  # Masked pixels were made identical, so they never count as changed
+    results = {
+        "ssim_score": 1.0,
+        "pyramid_refined_tiles": 0,
+        "pyramid_total_tiles": 0,
+        "pyramid_decision": None,
+        "pyramid_estimate_margin": None,  # Set when the score is estimated from sampled tiles
+    }
+    if cv2.countNonZero(diff) == 0:
+        results["pyramid_decision"] = "identical"
+        return results
+
+    # Full-resolution tiles, with the area that counts towards the score
+    h, w = gray1.shape[:2]
+    unchanged_area = 0
+    changed = []
+    for y in range(0, h, PYRAMID_TILE_SIZE):
+        for x in range(0, w, PYRAMID_TILE_SIZE):
+            y2, x2 = min(y + PYRAMID_TILE_SIZE, h), min(x + PYRAMID_TILE_SIZE, w)
+            area = (y2 - y) * (x2 - x)
+            if "mask" in ctx:
+                area = int(np.count_nonzero(~ctx["mask"][y:y2, x:x2]))
+                if area == 0:
+                    continue  # Fully masked tile
+            results["pyramid_total_tiles"] += 1
+            # Edge slivers too thin for the SSIM window are counted as unchanged
+            if cv2.countNonZero(diff[y:y2, x:x2]) and min(y2 - y, x2 - x) >= MS_SSIM_MIN_SIDE:
+                changed.append((y, y2, x, x2, area))
+            else:
+                unchanged_area += area
+    changed_area = sum(tile[4] for tile in changed)
+    total_area = unchanged_area + changed_area
+    if not total_area:
+        return results
+
+    def tile_ssim(tile):
+        y, y2, x, x2, _ = tile
+        return float(ssim(gray1[y:y2, x:x2], gray2[y:y2, x:x2]))
+
+    if len(changed) <= PYRAMID_SAMPLE_ABOVE_TILES:
+        changed_sum = sum(tile_ssim(tile) * tile[4] for tile in changed)
+        results["ssim_score"] = (unchanged_area + changed_sum) / total_area
+        results["pyramid_refined_tiles"] = len(changed)
+        results["pyramid_decision"] = "refined"
+        return results
+
+    # Many changed tiles: estimate their score from random ones until the page score is
+    # tight enough. Unchanged tiles are exact, so only the changed share carries error.
+    order = np.random.default_rng(0).permutation(len(changed))  # Fixed seed: repeatable scores
+    changed_share = changed_area / total_area
+    scores, areas = [], []
+    margin = None
+    for idx in order:
+        scores.append(tile_ssim(changed[idx]))
+        areas.append(changed[idx][4])
+        n = len(scores)
+        if n < PYRAMID_MIN_SAMPLE_TILES or (n - PYRAMID_MIN_SAMPLE_TILES) % PYRAMID_SAMPLE_BATCH_TILES:
+            continue
+        weights = np.array(areas, dtype=float) / sum(areas)
+        estimate = float(np.dot(weights, scores))
+        variance = float(np.dot(weights, (np.array(scores) - estimate) ** 2))
+        # Standard error with the finite population correction (sampling without replacement)
+        standard_error = np.sqrt(variance / n * max(0.0, 1.0 - n / len(changed)))
+        margin = PYRAMID_SAMPLE_CONFIDENCE_Z * standard_error * changed_share
+        if margin <= PYRAMID_SAMPLED_SSIM_TOLERANCE:
+            break
+    changed_score = float(np.dot(np.array(areas, dtype=float) / sum(areas), scores))
+    results["ssim_score"] = (unchanged_area + changed_score * changed_area) / total_area
+    results["pyramid_refined_tiles"] = len(scores)
+    sampled_all = len(scores) >= len(changed)
+    results["pyramid_decision"] = "refined" if sampled_all else "sampled"
+    results["pyramid_estimate_margin"] = None if sampled_all or margin is None else float(margin)
+    return results
+
+
+def _phash(gray):
+    small = cv2.resize(gray, (PHASH_SIZE, PHASH_SIZE), interpolation=cv2.INTER_AREA)
+    dct = cv2.dct(np.float32(small))[:PHASH_LOW_FREQ, :PHASH_LOW_FREQ]
+    return dct > np.median(dct)
+
+
+def metric_phash(ctx):
+    distance = int(np.count_nonzero(_phash(ctx["gray1"]) != _phash(ctx["gray2"])))
+    return {"phash_distance": distance}
+
+
+def metric_color_delta(ctx):
+    if "rgb1" not in ctx:
+        return {"color_delta": None}
+    # Mean absolute difference per channel over unmasked pixels, all channels in one
+    # vectorized pass; masked pixels were made identical, so they only add zeros to the sum
+    total_pixels = _total_pixels(ctx)
+    if total_pixels == 0:
+        return {"color_delta": None}
+    delta = cv2.absdiff(ctx["rgb1"], ctx["rgb2"]).reshape(-1, 3).sum(axis=0, dtype=np.float64) / total_pixels
+    return {
+        "color_delta": {
+            "r": float(delta[0]),
+            "g": float(delta[1]),
+            "b": float(delta[2]),
+        }
+    }
+
+
+def metric_edge_diff(ctx):
+    edges1, edges2 = _edges(ctx)
+    total_pixels = _total_pixels(ctx)
+    changed = cv2.countNonZero(cv2.bitwise_xor(edges1, edges2))
+    return {
+        "edge_diff_percent": (changed / total_pixels) * 100 if total_pixels > 0 else 0.0
+    }
+
+
+def metric_pixel_diff(ctx):
+    total_pixels = _total_pixels(ctx)
+    diff_pixels = cv2.countNonZero(_threshold_img(ctx))
+    return {
+        "diff_percent": (diff_pixels / total_pixels) * 100 if total_pixels > 0 else 0
+    }
+
+
+def metric_contours(ctx):
+    results = {
+        "num_significant_diff_regions": 0,
+        "largest_diff_region_area_percent": None,
+        "diff_regions": [],
+        "diff_regions2": [],
+    }
+    total_pixels = _total_pixels(ctx)
+    contours, _ = cv2.findContours(
+        _threshold_img(ctx).copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+    )
+    if contours:
+        areas = np.array([cv2.contourArea(c) for c in contours])
+        significant = areas[areas >= MIN_CONTOUR_AREA]
+        results["num_significant_diff_regions"] = int(significant.size)
+        if significant.size:
+            results["largest_diff_region_area_percent"] = (
+                (float(significant.max()) / total_pixels) * 100 if total_pixels > 0 else 0.0
+            )
+            largest_first = np.argsort(-areas)[: min(MAX_REPORTED_DIFF_REGIONS, int(significant.size))]
+            boxes = [cv2.boundingRect(contours[idx]) for idx in largest_first]
+            results["diff_regions"] = [_to_page_box(ctx, box, 1) for box in boxes]
+            results["diff_regions2"] = [_to_page_box(ctx, box, 2) for box in boxes]
+    return results
+
+
+# name -> (function, cost). Cheap metrics are suitable for triage.
+METRICS = {
+    "phash": (metric_phash, "cheap"),
+    "color_delta": (metric_color_delta, "cheap"),
+    "pixel_diff": (metric_pixel_diff, "cheap"),
+    "contours": (metric_contours, "expensive"),
+    "edge_diff": (metric_edge_diff, "expensive"),
+    "pyramid_ssim": (metric_pyramid_ssim, "cheap"),
+    "ssim": (metric_ssim, "expensive"),
+    "ms_ssim": (metric_ms_ssim, "expensive"),
+}
+NEEDS_COLOR = {"color_delta"}
+
+DEFAULT_METRICS = ("ssim", "pixel_diff", "contours")
+TRIAGE_METRICS = ("phash", "color_delta", "pixel_diff")
+DETAIL_METRICS = ("ssim", "ms_ssim", "contours", "edge_diff")
+
+# Selectable analysis modes: name -> (first-pass metrics, metrics for flagged pages only)
+ANALYSIS_PRESETS = {
+    "standard": (DEFAULT_METRICS, None),
+    "triage": (TRIAGE_METRICS, DETAIL_METRICS),
+    "fast": (("pyramid_ssim", "pixel_diff", "contours"), None),
+    # pyramid_ssim is an estimate of 'ssim', so running both would only duplicate work
+    "all": (tuple(name for name in METRICS if name != "pyramid_ssim"), None),
+}
+
+
+def validate_metric_names(names):
+    unknown = [n for n in names if n not in METRICS]
+    if unknown:
+        raise ValueError(f"Unknown metric(s): {', '.join(unknown)}. Available: {', '.join(METRICS)}")
+    return tuple(names)
+
+
+# Fail at import rather than silently skipping a misspelled metric in every run
+for _preset_metrics in ANALYSIS_PRESETS.values():
+    for _names in _preset_metrics:
+        validate_metric_names(_names or ())
+
+
+def compute_metrics(ctx, names):
+    results = {}
+    # Order so metrics that produce shared intermediates (e.g. SSIM map) run first
+    ordered = sorted(names, key=lambda n: list(METRICS.keys()).index(n) if n in METRICS else -1)
+    for name in ordered:
+        if name not in METRICS:
+            print(f"  Warning: Unknown metric '{name}' skipped.")
+            continue
+        func, _ = METRICS[name]
+        try:
+            with instrumentation.timed("metric", metric=name):
+                results.update(func(ctx))
+        except Exception as e:
+            print(f"  ERROR computing metric '{name}': {e}")
+    return results
+
+
+def is_flagged(results):
+    """True if any triage metric in results indicates a meaningful difference."""
+    if results.get("phash_distance") is not None and results["phash_distance"] > TRIAGE_PHASH_FLAG_DISTANCE:
+        return True
+    if results.get("diff_percent") is not None and results["diff_percent"] > TRIAGE_DIFF_PERCENT_FLAG:
+        return True
+    color_delta = results.get("color_delta")
+    if color_delta and max(color_delta.values()) > TRIAGE_COLOR_DELTA_FLAG:
+        return True
+    if results.get("ssim_score") is not None and results["ssim_score"] < TRIAGE_SSIM_FLAG:
+        return True
+    return False
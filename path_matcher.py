@@ -0,0 +1,255 @@
+# path_matcher.py
+import re
+import zlib
+from collections import defaultdict
+
+# Pages are paired in stages, cheapest first:
+#   1. exact normalized path (crawler.get_normalized_relative_path)
+#   2. user-provided rewrite rules (regex -> replacement, applied to site 1 paths)
+#   3. fuzzy matching over title tokens, path tokens and a MinHash signature of
+#      the page text/DOM, using inverted indexes + LSH buckets so only pages that
+#      share something are ever scored (no all-pairs scan).
+
+MINHASH_NUM_PERM = 64
+MINHASH_BANDS = 16  # 16 bands x 4 rows; pages with ~0.5+ Jaccard collide in some band
+SHINGLE_SIZE = 4  # Words per text shingle
+MAX_TOKEN_DOC_FREQ = 50  # Tokens shared by more pages than this are too common to index
+# LSH buckets holding more pages than this are collisions on shared boilerplate
+# (nav, footer, page template) rather than on page content, so they are skipped.
+MAX_LSH_BUCKET_SIZE = 50
+MIN_MATCH_CONFIDENCE = 0.35
+
+FUZZY_WEIGHT_TITLE = 0.35
+FUZZY_WEIGHT_PATH = 0.25
+FUZZY_WEIGHT_CONTENT = 0.40
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_TOKEN_SPLIT_RE = re.compile(r"[^a-z0-9]+")
+
+
+def _stable_hash(value):
+    # Python's hash() is salted per process; crawls and comparisons run at different times.
+    return zlib.crc32(value.encode("utf-8")) & _MAX_HASH
+
+
+def _permutation_params(num_perm):
+    params = []
+    for i in range(num_perm):
+        a = _stable_hash(f"minhash-a-{i}") | 1
+        b = _stable_hash(f"minhash-b-{i}")
+        params.append((a, b))
+    return params
+
+
+_PERMUTATIONS = _permutation_params(MINHASH_NUM_PERM)
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return [tok for tok in _TOKEN_SPLIT_RE.split(text.lower()) if tok]
+
+
+def compute_minhash(shingles):
+    """
+    Returns a MinHash signature (list of ints) for an iterable of string shingles,
+    or None if there are no shingles.
+    """
+    hashed = {_stable_hash(s) for s in shingles}
+    if not hashed:
+        return None
+    return [
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashed)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def build_content_signature(soup):
+    """
+    Builds a MinHash signature from a parsed page: word shingles of the visible
+    text plus tag-path shingles of the DOM, so both copy and layout contribute.
+    """
+    try:
+        for tag in soup(["script", "style", "noscript"]):
+            tag.decompose()
+        words = tokenize(soup.get_text(" "))
+        shingles = set()
+        for i in range(max(1, len(words) - SHINGLE_SIZE + 1)):
+            chunk = words[i : i + SHINGLE_SIZE]
+            if chunk:
+                shingles.add("t:" + " ".join(chunk))
+        body = soup.body or soup
+        for el in body.find_all(True):
+            parent = el.parent
+            parent_name = parent.name if parent is not None else ""
+            shingles.add(f"d:{parent_name}>{el.name}")
+        return compute_minhash(shingles)
+    except Exception as e:
+        print(f"Error building content signature: {e}")
+        return None
+
+
+def minhash_similarity(sig1, sig2):
+    if not sig1 or not sig2 or len(sig1) != len(sig2):
+        return 0.0
+    return sum(1 for x, y in zip(sig1, sig2) if x == y) / float(len(sig1))
+
+
+def jaccard(tokens1, tokens2):
+    s1, s2 = set(tokens1), set(tokens2)
+    if not s1 or not s2:
+        return 0.0
+    return len(s1 & s2) / float(len(s1 | s2))
+
+
+def parse_rewrite_rules(rules_text):
+    """
+    Parses user-provided rules, one per line, as 'pattern => replacement'.
+    Patterns are regular expressions matched at the start of the normalized site 1
+    path, and only that leading match is replaced, so a plain prefix such as
+    'about-us => company/about' rewrites 'about-us/team' to 'company/about/team'.
+    Blank lines and lines starting with '#' are ignored.
+    """
+    rules = []
+    if not rules_text:
+        return rules
+    for line_no, line in enumerate(rules_text.splitlines(), start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if "=>" not in line:
+            print(f"Warning: Ignoring rewrite rule on line {line_no} (missing '=>'): {line}")
+            continue
+        pattern, replacement = (part.strip() for part in line.split("=>", 1))
+        try:
+            rules.append((re.compile(pattern), replacement))
+        except re.error as e:
+            print(f"Warning: Ignoring invalid rewrite rule regex on line {line_no} '{pattern}': {e}")
+    return rules
+
+
+def apply_rewrite_rules(path, rules):
+    for regex, replacement in rules:
+        if regex.match(path):
+            return regex.sub(replacement, path, count=1).strip("/")
+    return None
+
+
+def _page_features(path, data):
+    return {
+        "title_tokens": tokenize(data.get("title") if data else None),
+        "path_tokens": tokenize(path),
+        "minhash": data.get("minhash") if data else None,
+    }
+
+
+def _build_indexes(features2):
+    token_index = defaultdict(set)
+    lsh_index = defaultdict(set)
+    rows = MINHASH_NUM_PERM // MINHASH_BANDS
+    for path, feats in features2.items():
+        for tok in set(feats["title_tokens"]):
+            token_index["t:" + tok].add(path)
+        for tok in set(feats["path_tokens"]):
+            token_index["p:" + tok].add(path)
+        sig = feats["minhash"]
+        if sig and len(sig) == MINHASH_NUM_PERM:
+            for band in range(MINHASH_BANDS):
+                lsh_index[(band, tuple(sig[band * rows : (band + 1) * rows]))].add(path)
+    return token_index, lsh_index
+
+
+def _candidates(feats, token_index, lsh_index):
+    candidates = set()
+    rows = MINHASH_NUM_PERM // MINHASH_BANDS
+    for prefix, tokens in (("t:", feats["title_tokens"]), ("p:", feats["path_tokens"])):
+        for tok in set(tokens):
+            bucket = token_index.get(prefix + tok)
+            if bucket and len(bucket) <= MAX_TOKEN_DOC_FREQ:
+                candidates |= bucket
+    sig = feats["minhash"]
+    if sig and len(sig) == MINHASH_NUM_PERM:
+        for band in range(MINHASH_BANDS):
+            bucket = lsh_index.get((band, tuple(sig[band * rows : (band + 1) * rows])))
+            if bucket and len(bucket) <= MAX_LSH_BUCKET_SIZE:
+                candidates |= bucket
+    return candidates
+
+
+def _fuzzy_score(feats1, feats2):
+    weighted = [
+        (FUZZY_WEIGHT_TITLE, feats1["title_tokens"] and feats2["title_tokens"],
+         lambda: jaccard(feats1["title_tokens"], feats2["title_tokens"])),
+        (FUZZY_WEIGHT_PATH, feats1["path_tokens"] and feats2["path_tokens"],
+         lambda: jaccard(feats1["path_tokens"], feats2["path_tokens"])),
+        (FUZZY_WEIGHT_CONTENT, feats1["minhash"] and feats2["minhash"],
+         lambda: minhash_similarity(feats1["minhash"], feats2["minhash"])),
+    ]
+    # Only weigh signals both pages actually have (e.g. loaded crawls may lack signatures)
+    total_weight = sum(w for w, available, _ in weighted if available)
+    if total_weight == 0:
+        return 0.0
+    return sum(w * score() for w, available, score in weighted if available) / total_weight
+
+
+def match_pages(pages1_data, pages2_data, rewrite_rules=None, min_confidence=MIN_MATCH_CONFIDENCE):
+    """
+    Pairs pages from two crawls. Returns a list of dicts:
+        {"path1": str|None, "path2": str|None, "method": str, "confidence": float|None}
+    where method is 'exact', 'rule', 'fuzzy' or 'unmatched'. Each page appears once.
+    """
+    rewrite_rules = rewrite_rules or []
+    unmatched1 = set(pages1_data.keys())
+    unmatched2 = set(pages2_data.keys())
+    matches = []
+
+    # 1. Exact normalized path
+    for path in sorted(unmatched1 & unmatched2):
+        matches.append({"path1": path, "path2": path, "method": "exact", "confidence": 1.0})
+    unmatched1 -= unmatched2
+    unmatched2 -= {m["path2"] for m in matches}
+
+    # 2. Rewrite rules
+    if rewrite_rules:
+        for path1 in sorted(unmatched1):
+            target = apply_rewrite_rules(path1, rewrite_rules)
+            if target is not None and target in unmatched2:
+                matches.append({"path1": path1, "path2": target, "method": "rule", "confidence": 1.0})
+                unmatched2.discard(target)
+        unmatched1 -= {m["path1"] for m in matches if m["method"] == "rule"}
+
+    # 3. Fuzzy matching via inverted token index + MinHash LSH
+    if unmatched1 and unmatched2:
+        features1 = {p: _page_features(p, pages1_data[p]) for p in unmatched1}
+        features2 = {p: _page_features(p, pages2_data[p]) for p in unmatched2}
+        token_index, lsh_index = _build_indexes(features2)
+
+        scored = []
+        for path1, feats1 in features1.items():
+            for path2 in _candidates(feats1, token_index, lsh_index):
+                score = _fuzzy_score(feats1, features2[path2])
+                if score >= min_confidence:
+                    scored.append((score, path1, path2))
+
+        # Greedy one-to-one assignment, best scores first
+        scored.sort(key=lambda x: (-x[0], x[1], x[2]))
+        for score, path1, path2 in scored:
+            if path1 in unmatched1 and path2 in unmatched2:
+                matches.append({"path1": path1, "path2": path2, "method": "fuzzy", "confidence": score})
+                unmatched1.discard(path1)
+                unmatched2.discard(path2)
+
+    for path1 in sorted(unmatched1):
+        matches.append({"path1": path1, "path2": None, "method": "unmatched", "confidence": None})
+    for path2 in sorted(unmatched2):
+        matches.append({"path1": None, "path2": path2, "method": "unmatched", "confidence": None})
+
+    num_fuzzy = sum(1 for m in matches if m["method"] == "fuzzy")
+    num_rule = sum(1 for m in matches if m["method"] == "rule")
+    print(
+        f"Path matching: {len(matches)} entries "
+        f"({num_rule} via rewrite rules, {num_fuzzy} via fuzzy matching, "
+        f"{len(unmatched1)} only in site 1, {len(unmatched2)} only in site 2)."
+    )
+    return matches